@@ -1,81 +1,32 @@
-import copy
 import random
 import math
-from board import graph, SIZE, NEUTRAL, WHITE, BLUE, DIRECTIONS
-from pieces import stack, Piece
-from handlers import check_flip
-
-
-# ------------------ GAME STATE CLASS ------------------
-class GameState:
-    def __init__(self, cells, pieces, stack):
-        self.cells = cells          # List of cells on the board
-        self.pieces = pieces        # All placed pieces
-        self.stack = stack          # Piece stock for each player
-        self.last_action = {        # Information about the last move
-            "player": None,
-            "type": None,
-            "cell_id": None
-        }
+import time
+import parallel
+from gamestate import GameState, popcount, encode_move, decode_move
+from mcts_tree import MCTSTree, NO_NODE, UNKNOWN
+from opening_book import book_move
+from rules import legal_moves, terminal_score
+import tablebase
+from threats import winning_moves, losing_moves, flip_line
+from transposition import TranspositionTable, position_key, EXACT, LOWER, UPPER
+
+transposition_table = TranspositionTable() # Shared by every minimax search
+MAX_DEPTH = 32 # Deepest iteration of a search limited only by time
+TIE_MARGIN = 0.1 # Smaller than the gap between two different evaluations
+ROLLOUT_POLICY = "pattern" # Default MCTS simulation policy (see ROLLOUT_POLICIES)
 
-    def clone(self):
-        return copy.deepcopy(self)
+
+# Raised inside minimax when the time budget of the search runs out
+class SearchTimeout(Exception):
+    pass
 
 
 # ------------------ LIST POSSIBLE MOVES ------------------
-def list_possible_moves(state: GameState, player: int, is_first_move=None):
-    if is_first_move is None:
-        is_first_move = not any(p.player == player and p.cell is not None for p in state.pieces)
-
-    moves = []
-
-    # Placement moves: if there are pieces left in the stack
-    if state.stack.stack[player] > 0:
-        for cell in state.cells:
-            if cell.piece is None:
-                # Do not allow placement on corner cells on the first move
-                if is_first_move and cell.id in [0, SIZE - 1, SIZE * SIZE - SIZE, SIZE * SIZE - 1]:
-                    continue
-                moves.append(("placement", cell))
-
-    # Movement moves: for each piece of the player on the board
-    for piece in state.pieces:
-        if piece.player == player and piece.cell is not None:
-            destinations = get_valid_moves(piece)
-            for dest in destinations:
-                moves.append(("move", piece.cell, dest))
-
-    return moves
-
-
-# ------------------ GET VALID MOVES ------------------
-def get_valid_moves(piece: Piece):
-    moves = []
-    for direction in DIRECTIONS:
-        moves.extend(validate_direction(piece.cell, piece, False, direction))
-    return moves
-
-def validate_direction(current_cell, piece: Piece, color_switched, direction):
-    moves = []
-    next_cell = current_cell.neighbors.get(direction)
-    
-    # Stop if there is no neighbor or it is occupied
-    if next_cell is None or next_cell.piece is not None:
-        return moves
-
-    # Determine if the next cell is of the "correct" color based on the player's color
-    correct_color = (piece.player == 0 and next_cell.type == BLUE) or (piece.player == 1 and next_cell.type == WHITE)
-
-    if current_cell.type == next_cell.type:
-        moves.append(next_cell)
-        if correct_color:
-            moves.extend(validate_direction(next_cell, piece, color_switched, direction))
-    elif not color_switched:
-        moves.append(next_cell)
-        if correct_color:
-            moves.extend(validate_direction(next_cell, piece, True, direction))
-
-    return moves
+# Moves are ("placement", cell_id) or ("move", origin_id, destination_id). The list comes from the
+# move cache of the rules kernel; it is a copy, so the search can reorder it. Code that only reads
+# the moves uses legal_moves() directly
+def list_possible_moves(state: GameState, player: int):
+    return list(legal_moves(state, player))
 
 
 # ------------------ APPLY MOVE ------------------
@@ -83,277 +34,780 @@ def apply_move(state: GameState, move, player: int):
     new_state = state.clone()
 
     if move[0] == "placement":
-        cell = move[1]
-        target_cell = next(c for c in new_state.cells if c.id == cell.id)
-        if new_state.stack.stack[player] > 0 and target_cell.piece is None:
-            new_state.stack.stack[player] -= 1
-            piece = Piece(player)
-            piece.insert_piece(target_cell)
-            new_state.pieces.append(piece)
-            new_state.last_action = {"player": player, "type": "placement", "cell_id": target_cell.id}
+        if new_state.stack[player] > 0 and not new_state.occupied() >> move[1] & 1:
+            new_state.make_move(move, player)
 
     elif move[0] == "move":
-        origin, destination = move[1], move[2]
-        new_origin = next(c for c in new_state.cells if c.id == origin.id)
-        new_dest = next(c for c in new_state.cells if c.id == destination.id)
-        piece = new_origin.piece
-        if piece:
-            piece.move_to(new_dest)
-            check_flip(new_dest)
-            new_state.last_action = {"player": player, "type": "move", "cell_id": new_dest.id}
+        if new_state.occupancy[player] >> move[1] & 1:
+            new_state.make_move(move, player)
 
     return new_state
 
 
 # ------------------ HEURISTIC EVALUATION ------------------
-def count_in_line(cell, player, dir1, dir2):
-    count = 1
-    next_cell = cell.neighbors.get(dir1)
-    while next_cell and next_cell.piece and next_cell.piece.player == player:
-        count += 1
-        next_cell = next_cell.neighbors.get(dir1)
-    next_cell = cell.neighbors.get(dir2)
-    while next_cell and next_cell.piece and next_cell.piece.player == player:
-        count += 1
-        next_cell = next_cell.neighbors.get(dir2)
-    return count
-
-
+# Every piece scores the value of the longest line through it (positive for player, negative for the
+# opponent). The state keeps how many pieces have each longest line up to date on every move,
+# so this costs O(board size) instead of a scan of every line of every piece
 def evaluate_state(state: GameState, player: int):
     score = 0
     values = {1: 1, 2: 10, 3: 100, 4: 1000, 5: -10000}
 
-    for cell in state.cells:
-        if cell.piece:
-            p = cell.piece.player
-            max_line = max(
-                count_in_line(cell, p, "UP", "DOWN"),
-                count_in_line(cell, p, "UP_RIGHT", "DOWN_LEFT"),
-                count_in_line(cell, p, "UP_LEFT", "DOWN_RIGHT")
-            )
-            if p == player:
-                score += values.get(max_line, 0)
-            else:
-                score -= values.get(max_line, 0)
-
-    player_pieces = sum(1 for p in state.pieces if p.player == player)
-    opponent_pieces = sum(1 for p in state.pieces if p.player != player)
+    for p in (0, 1):
+        for length, count in enumerate(state.line_tally[p]):
+            if count:
+                if p == player:
+                    score += values.get(length, 0) * count
+                else:
+                    score -= values.get(length, 0) * count
+
+    # Every piece is in exactly one tally entry
+    player_pieces = sum(state.line_tally[player])
+    opponent_pieces = sum(state.line_tally[1 - player])
     score += (player_pieces - opponent_pieces)
 
-    action = state.last_action
-    if action["player"] == player:
-        score += 0.5 if action["type"] == "move" else -0.2
+    if state.last_player == player:
+        score += 0.5 if state.last_type == "move" else -0.2
     else:
-        score -= 0.5 if action["type"] == "move" else -0.2
+        score -= 0.5 if state.last_type == "move" else -0.2
 
     return score
 
 
 # ------------------ CHECK IF GAME OVER ------------------
-def is_terminal_state(state: GameState, player: int):
-    action = state.last_action
-    if action["player"] is None:
-        return False, evaluate_state(state, player)
-
-    last_cell = next((c for c in state.cells if c.id == action["cell_id"]), None)
-    if not last_cell or not last_cell.piece:
-        return False, evaluate_state(state, player)
-
-    player_turn = action["player"]
-    longest = max(
-        count_in_line(last_cell, player_turn, "UP", "DOWN"),
-        count_in_line(last_cell, player_turn, "UP_RIGHT", "DOWN_LEFT"),
-        count_in_line(last_cell, player_turn, "UP_LEFT", "DOWN_RIGHT")
-    )
-
-    if longest >= 5:
-        return True, -100000 if player_turn == player else 100000
-    if longest == 4 and action["type"] == "move":
-        return True, 100000 if player_turn == player else -100000
+# terminal_score() is the one of the rules kernel
+
+# Score of a solved endgame from player's point of view, None if the tablebase does not have it.
+# A win in d plies scores 100000 - d, so faster wins (and slower losses) are preferred
+def endgame_score(state: GameState, to_move: int, player: int):
+    distance = tablebase.probe(state, to_move)
+    if distance is None:
+        return None
+    if distance == 0:
+        return 0
+    score = 100000 - abs(distance)
+    return score if (distance > 0) == (to_move == player) else -score
+
 
+# Winner of a solved endgame with turn to move, None if it is a draw or not in the tablebase
+def endgame_winner(state: GameState, turn: int):
+    distance = tablebase.probe(state, turn)
+    if not distance:
+        return None
+    return turn if distance > 0 else 1 - turn
+
+
+def is_terminal_state(state: GameState, player: int):
+    score = terminal_score(state, player)
+    if score is not None:
+        return True, score
     return False, evaluate_state(state, player)
 
 
+# ------------------ SEARCH CONTEXT ------------------
+# Counters of a minimax search, used to check that move ordering pays off
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0               # Nodes visited
+        self.interior_nodes = 0      # Nodes whose moves were searched
+        self.legal_moves = 0         # Moves generated at interior nodes
+        self.moves_searched = 0      # Moves actually searched at interior nodes
+        self.cutoffs = 0             # Alpha-beta cutoffs
+        self.first_move_cutoffs = 0  # Cutoffs caused by the first move searched
+        self.tt_hits = 0             # Transposition table probes that found the position
+        self.tablebase_probes = 0    # Endgame positions (both stacks empty) looked up in the tablebase
+        self.tablebase_hits = 0      # Endgame positions valued by the tablebase
+        self.max_depth = 0           # Deepest fully searched iteration
+
+    def report(self):
+        interior = self.interior_nodes or 1
+        return {
+            "nodes": self.nodes,
+            "max_depth": self.max_depth,
+            "branching_factor": self.moves_searched / interior,
+            "legal_branching_factor": self.legal_moves / interior,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            "tt_hits": self.tt_hits,
+            "tablebase_probes": self.tablebase_probes,
+            "tablebase_hits": self.tablebase_hits,
+        }
+
+    # Counters written to the game log for every move
+    def log_fields(self):
+        return {"nodes": self.nodes, "cutoffs": self.cutoffs, "tt_hits": self.tt_hits, "max_depth": self.max_depth}
+
+    # Add the counters of a search done elsewhere (e.g. in a worker process)
+    def merge(self, other):
+        for name in ("nodes", "interior_nodes", "legal_moves", "moves_searched", "cutoffs", "first_move_cutoffs", "tt_hits",
+                     "tablebase_probes", "tablebase_hits"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+# State shared by all the nodes of one search. Counters are only kept when a SearchStats is
+# given, so a search without one does no bookkeeping at all
+class Search:
+    def __init__(self, table=None, deadline=None, stats=None, cancel=None):
+        self.table = table
+        self.deadline = deadline
+        self.stats = stats
+        self.cancel = cancel  # threading.Event that stops the search when set (e.g. by a pondering thread's owner)
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)] # Two quiet moves per ply that caused cutoffs
+        self.history = {}                                            # (player, move) -> cutoff score over the search
+
+
+# ------------------ MOVE ORDERING ------------------
+# Transposition move first, then immediate wins, then moves that flip pieces (by pieces flipped and the
+# longest line made, through the flipped pieces as well) or make lines, then killer moves of this ply,
+# then the rest by history score; moves making 5 in a row go last
+def order_moves(state: GameState, moves, player: int, search: Search, ply: int, tt_move=None):
+    killers = search.killers[ply]
+    history = search.history
+
+    def priority(move):
+        if move == tt_move:
+            return (5, 0)
+        longest, flipped = state.move_effect(move, player)
+        if longest >= 5:
+            return (0, 0)
+        if longest == 4 and move[0] == "move":
+            return (4, 0)
+        if flipped:
+            # Lines the flipped pieces end up in count like lines through the destination
+            return (3, 10 * popcount(flipped) + max(longest, flip_line(state, move, player, flipped)))
+        if longest >= 3:
+            return (3, longest)
+        if move == killers[0]:
+            return (2, 1)
+        if move == killers[1]:
+            return (2, 0)
+        return (1, history.get((player, move), 0))
+
+    moves.sort(key=priority, reverse=True)
+
+
+def record_cutoff(search: Search, move, player: int, depth: int, ply: int, index: int):
+    stats = search.stats
+    if stats is not None:
+        stats.cutoffs += 1
+        if index == 0:
+            stats.first_move_cutoffs += 1
+    killers = search.killers[ply]
+    if move != killers[0]:
+        killers[1] = killers[0]
+        killers[0] = move
+    search.history[(player, move)] = search.history.get((player, move), 0) + depth * depth
+
+
 # ------------------ MINIMAX WITH ALPHA-BETA PRUNING ------------------
-def minimax(state: GameState, depth: int, alpha: float, beta: float, maximizing: bool, player: int):
-    terminal, score = is_terminal_state(state, player)
-    if depth == 0 or terminal:
+def minimax(state: GameState, depth: int, alpha: float, beta: float, maximizing: bool, player: int, search=None, ply=0):
+    if search is None:
+        search = Search()
+    stats = search.stats
+    if stats is not None:
+        stats.nodes += 1
+    if search.deadline is not None and time.perf_counter() > search.deadline:
+        raise SearchTimeout()
+    if search.cancel is not None and search.cancel.is_set():
+        raise SearchTimeout()
+
+    score = terminal_score(state, player)
+    if score is not None:
         return score
-
+    to_move = player if maximizing else 1 - player
+
+    # Solved endgame: the tablebase value replaces the rest of the search
+    if not state.stack[0] and not state.stack[1]:
+        score = endgame_score(state, to_move, player)
+        if stats is not None:
+            stats.tablebase_probes += 1
+        if score is not None:
+            if stats is not None:
+                stats.tablebase_hits += 1
+            return score
+    if depth == 0:
+        return evaluate_state(state, player)
+
+    moves = list_possible_moves(state, to_move)
+    table = search.table
+    tt_move = None
+
+    # Transposition table: the terminal check above comes first because it depends on the last move,
+    # which the hash does not include. Only entries of the same depth are used, so the values are
+    # exactly those of a plain fixed-depth search
+    if table is not None:
+        key = position_key(state, player, to_move)
+        entry = table.probe(key)
+        if entry is not None:
+            if stats is not None:
+                stats.tt_hits += 1
+            entry_depth, value, flag, tt_move = entry
+            if entry_depth == depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if beta <= alpha:
+                    return value
+        alpha_start, beta_start = alpha, beta
+
+    if depth > 1 or len(moves) > 1:
+        order_moves(state, moves, to_move, search, ply, tt_move)
+    if stats is not None:
+        stats.interior_nodes += 1
+        stats.legal_moves += len(moves)
+
+    best = None
     if maximizing:
         max_eval = -float('inf')
-        for move in list_possible_moves(state, player):
-            new_state = apply_move(state, move, player)
-            eval = minimax(new_state, depth - 1, alpha, beta, False, player)
-            max_eval = max(max_eval, eval)
+        for index, move in enumerate(moves):
+            state.make_move(move, player)
+            eval = minimax(state, depth - 1, alpha, beta, False, player, search, ply + 1)
+            state.unmake_move()
+            if eval > max_eval:
+                max_eval, best = eval, move
             alpha = max(alpha, eval)
             if beta <= alpha:
+                record_cutoff(search, move, player, depth, ply, index)
                 break
-        return max_eval
+        if stats is not None and moves:
+            stats.moves_searched += index + 1
+        value = max_eval
     else:
         min_eval = float('inf')
         opponent = 1 - player
-        for move in list_possible_moves(state, opponent):
-            new_state = apply_move(state, move, opponent)
-            eval = minimax(new_state, depth - 1, alpha, beta, True, player)
-            min_eval = min(min_eval, eval)
+        for index, move in enumerate(moves):
+            state.make_move(move, opponent)
+            eval = minimax(state, depth - 1, alpha, beta, True, player, search, ply + 1)
+            state.unmake_move()
+            if eval < min_eval:
+                min_eval, best = eval, move
             beta = min(beta, eval)
             if beta <= alpha:
+                record_cutoff(search, move, opponent, depth, ply, index)
                 break
-        return min_eval
+        if stats is not None and moves:
+            stats.moves_searched += index + 1
+        value = min_eval
+
+    if table is not None:
+        if value <= alpha_start:
+            flag = UPPER
+        elif value >= beta_start:
+            flag = LOWER
+        else:
+            flag = EXACT
+        table.store(key, depth, value, flag, best)
+
+    return value
 
 
 # ------------------ FIND BEST MOVE USING MINIMAX ------------------
-def best_move(state: GameState, player: int, depth: int):
-    first_turn = not any(p.player == player and p.cell is not None for p in state.pieces)
-    winning = []
+# Value of every root move searched to the given depth, in the given order. Each move is searched
+# with alpha just below the best value so far: worse moves fail low and are cut early, while moves
+# that tie with the best keep their exact value, so the set of best moves is the same as a full search
+def search_root(state: GameState, player: int, moves, depth: int, search=None):
+    if search is None:
+        search = Search()
+    values = []
+    best_value = -float('inf')
+    for move in moves:
+        state.make_move(move, player)
+        try:
+            value = minimax(state, depth - 1, best_value - TIE_MARGIN, float('inf'), False, player, search, 1)
+        finally:
+            state.unmake_move()
+        values.append(value)
+        best_value = max(best_value, value)
+    return values
+
+
+# ------------------ ROOT-PARALLEL MINIMAX ------------------
+# Runs in a worker process: value of one root move, searched with alpha just below the best
+# root value any process has found so far
+def search_root_move(state: GameState, player: int, move, depth: int, time_left=None, collect_stats=False):
+    deadline = time.perf_counter() + time_left if time_left is not None else None
+    search = Search(transposition_table, deadline, SearchStats() if collect_stats else None)
+    alpha = parallel.read_alpha() - TIE_MARGIN
+    state.make_move(move, player)
+    value = minimax(state, depth - 1, alpha, float('inf'), False, player, search, 1)
+    parallel.raise_alpha(value)
+    return value, search.stats
+
+
+# Same result as search_root, with the root moves split over the process pool. Young Brothers
+# Wait: the first (best ordered) move is searched here to get a bound before the others start
+def parallel_search_root(state: GameState, player: int, moves, depth: int, search: Search, workers=None):
+    values = search_root(state, player, moves[:1], depth, search)
+    pool = parallel.get_pool(workers)
+    parallel.reset_alpha(values[0])
+    time_left = search.deadline - time.perf_counter() if search.deadline is not None else None
+
+    collect_stats = search.stats is not None
+    futures = [pool.submit(search_root_move, state, player, move, depth, time_left, collect_stats) for move in moves[1:]]
+    try:
+        for future in futures:
+            value, stats = future.result()
+            values.append(value)
+            if collect_stats:
+                search.stats.merge(stats)
+    except SearchTimeout:
+        for future in futures:
+            future.cancel()
+        raise
+    return values
+
+
+# Iterative deepening: search depth 1, 2, ... until max depth or until the time budget
+# (in milliseconds) runs out, keeping the result of the deepest fully searched iteration
+# With workers > 1, iterations from depth 3 split the root moves over a process pool
+# With use_book, a position of the opening book is answered with its book move without searching
+# Setting the cancel event stops the search; a search cancelled before depth 1 completes returns None
+def best_move(state: GameState, player: int, depth=None, table=transposition_table, time_budget=None, stats=None, workers=1,
+              use_book=True, cancel=None):
+    if depth is None and time_budget is None:
+        raise ValueError("best_move needs a depth or a time budget")
+    max_depth = min(depth, MAX_DEPTH) if depth is not None else MAX_DEPTH
+    deadline = time.perf_counter() + time_budget / 1000 if time_budget is not None else None
+    search = Search(table, None, stats, cancel)
+
+    state = state.clone()
+    moves = list_possible_moves(state, player)
+    if not moves:
+        return None
 
     # Check for immediate winning moves
-    for move in list_possible_moves(state, player, first_turn):
-        new_state = apply_move(state, move, player)
-        is_term, score = is_terminal_state(new_state, player)
-        if is_term and score > 0:
-            winning.append(move)
+    winning = winning_moves(state, player, moves)
     if winning:
         return random.choice(winning)
+    if len(moves) == 1:
+        return moves[0]
+    if use_book:
+        move = book_move(state, player)
+        if move in moves:
+            return move
+
+    # Start with the best move of a previous search of this position
+    if table is not None:
+        key = position_key(state, player, player)
+        entry = table.probe(key)
+        if entry is not None and entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+
+    for current_depth in range(1, max_depth + 1):
+        # Depth 1 always completes so there is a move to return
+        search.deadline = deadline if current_depth > 1 else None
+        try:
+            if workers > 1 and current_depth >= 3:
+                values = parallel_search_root(state, player, moves, current_depth, search, workers)
+            else:
+                values = search_root(state, player, moves, current_depth, search)
+        except SearchTimeout:
+            if current_depth == 1:
+                return None # Cancelled
+            break
 
-    best_value = -float('inf')
-    best_moves = []
+        best_value = max(values)
+        best_moves = [move for move, value in zip(moves, values) if value == best_value]
+        searched_depth = current_depth
+        if stats is not None:
+            stats.max_depth = current_depth
+
+        # Next iteration searches the best moves of this one first
+        order = sorted(range(len(moves)), key=lambda i: -values[i])
+        moves = [moves[i] for i in order]
 
-    for move in list_possible_moves(state, player, first_turn):
-        new_state = apply_move(state, move, player)
-        value = minimax(new_state, depth - 1, -float('inf'), float('inf'), False, player)
-        if value > best_value:
-            best_value = value
+        if best_value >= 100000 or (deadline is not None and time.perf_counter() > deadline):
+            break
+
+    chosen = random.choice(best_moves)
+    if table is not None:
+        table.store(key, searched_depth, best_value, EXACT, chosen)
+    return chosen
+
+
+# ------------------ MCTS STATISTICS ------------------
+class MCTSStats:
+    def __init__(self):
+        self.iterations = 0  # Selection / expansion / rollout / backpropagation cycles
+        self.rollouts = 0    # Simulations played
+        self.nodes = 0       # Tree nodes created
+        self.elapsed = 0.0   # Wall time in seconds
+        self.carried_visits = 0  # Visits kept from the previous turn's tree
+        self.tree_nodes = 0  # Nodes in the last tree searched
+        self.tree_bytes = 0  # Memory of the node arrays of that tree
+        self.tablebase_probes = 0  # New leaves with both stacks empty looked up in the tablebase
+        self.tablebase_hits = 0    # New leaves whose winner the tablebase knew (no rollout played)
+
+    def report(self):
+        return {
+            "iterations": self.iterations,
+            "rollouts": self.rollouts,
+            "tablebase_probes": self.tablebase_probes,
+            "tablebase_hits": self.tablebase_hits,
+            "nodes": self.nodes,
+            "elapsed": self.elapsed,
+            "carried_visits": self.carried_visits,
+            "tree_nodes": self.tree_nodes,
+            "bytes_per_node": self.tree_bytes / self.tree_nodes if self.tree_nodes else 0.0,
+            "iterations_per_second": self.iterations / self.elapsed if self.elapsed else 0.0,
+        }
+
+    # Counters written to the game log for every move
+    def log_fields(self):
+        return {"iterations": self.iterations, "tree_nodes": self.tree_nodes, "rollouts": self.rollouts}
+
+    # Add the counters of a tree built elsewhere (e.g. in a worker process)
+    def merge(self, other):
+        self.iterations += other.iterations
+        self.rollouts += other.rollouts
+        self.nodes += other.nodes
+        self.tree_nodes += other.tree_nodes
+        self.tree_bytes += other.tree_bytes
+        self.tablebase_probes += other.tablebase_probes
+        self.tablebase_hits += other.tablebase_hits
+
+
+# ------------------ ROLLOUT POLICIES ------------------
+# A policy picks the move of one simulation ply; immediate wins are handled by rollout() first.
+# "random" is uniform, "greedy" evaluates the position after every legal move, and "pattern" scores
+# moves from the precomputed adjacency and sandwich tables without playing them, plus the lines
+# made by the pieces a capture flips
+LINE_WEIGHT = 2    # Pattern score per own piece next to the destination
+CAPTURE_WEIGHT = 3 # Pattern score per enemy piece flipped between the destination and an own piece
+FLIP_LINE_WEIGHT = 2 # Pattern score per piece past 2 in the longest line through the pieces a capture flips
+
+def random_policy(state, moves, turn, root_player, epsilon):
+    return random.choice(moves)
+
+
+def greedy_policy(state, moves, turn, root_player, epsilon):
+    # Epsilon-greedy: with probability epsilon choose random, else choose best move by evaluation
+    if random.random() < epsilon:
+        return random.choice(moves)
+    best_eval = -float('inf')
+    best_moves = []
+    for move in moves:
+        state.make_move(move, turn)
+        eval_score = evaluate_state(state, root_player)
+        state.unmake_move()
+        if eval_score > best_eval:
+            best_eval = eval_score
             best_moves = [move]
-        elif value == best_value:
+        elif eval_score == best_eval:
             best_moves.append(move)
+    return random.choice(best_moves)
+
+
+def pattern_policy(state, moves, turn, root_player, epsilon):
+    if random.random() < epsilon:
+        return random.choice(moves)
+    # Lines of 5 lose, so only play one when nothing else is left
+    losing = losing_moves(state, turn, moves)
+    if losing:
+        moves = [move for move in moves if move not in losing] or moves
+
+    topology = state.topology
+    adjacent = topology.adjacent
+    sandwiches = topology.sandwiches
+    own = state.occupancy[turn]
+    enemy = state.occupancy[1 - turn]
+    best_score = -1
+    best_moves = []
+    for move in moves:
+        if move[0] == "placement":
+            cell_id = move[1]
+            score = LINE_WEIGHT * popcount(adjacent[cell_id] & own)
+        else:
+            cell_id = move[2]
+            mover = own & ~(1 << move[1])
+            score = LINE_WEIGHT * popcount(adjacent[cell_id] & mover)
+            captures = 0
+            for middle, far in sandwiches[cell_id]:
+                if enemy & middle and mover & far:
+                    captures += 1
+            if captures:
+                # Only captures pay for the exact flips: a flip that makes a line is worth more
+                score += CAPTURE_WEIGHT * captures + FLIP_LINE_WEIGHT * max(0, flip_line(state, move, turn) - 2)
+        if score > best_score:
+            best_score = score
+            best_moves = [move]
+        elif score == best_score:
+            best_moves.append(move)
+    return random.choice(best_moves)
+
 
-    return random.choice(best_moves) if best_moves else None
-
-
-# ------------------ MCTS NODE CLASS ------------------
-class MCTSNode:
-    def __init__(self, state, parent, move, player_just_moved, next_player):
-        self.state = state              # Game state at this node
-        self.parent = parent            # Parent node
-        self.move = move                # Move that led to this node (None for root)
-        self.player_just_moved = player_just_moved  # Player who made the move
-        self.next_player = next_player  # Player whose turn is next
-        self.wins = 0                 # Number of wins (from the perspective of the root player)
-        self.visits = 0               # Number of visits to this node
-        self.untried_moves = list_possible_moves(state, next_player) # List of moves not yet explored from this state for next_player
-        self.children = []            # List of child nodes
-
-    # Select child with highest UCT value
-    def uct_select_child(self, exploration=math.sqrt(2)):
-        return max(
-            self.children,
-            key=lambda child: child.wins / child.visits + exploration * math.sqrt(math.log(self.visits) / child.visits)
-        )
-
-    # Expand node by trying one of the untried moves
-    def add_child(self, move, state):
-        child = MCTSNode(state, parent=self, move=move, player_just_moved=self.next_player, next_player=1 - self.next_player)
-        self.untried_moves.remove(move)
-        self.children.append(child)
-        return child
-
-    # Update node's statistics with simulation result
-    def update(self, simulation_winner):
-        self.visits += 1
-        if self.player_just_moved is not None and self.player_just_moved == simulation_winner:
-            self.wins += 1
-
-
-# ------------------ ENHANCED ROLLOUT (SIMULATION) FUNCTION ------------------
-def rollout(state, current_turn, root_player, max_rollout_steps=100, epsilon=0.3):
-    state_sim = copy.deepcopy(state)
+ROLLOUT_POLICIES = {"random": random_policy, "pattern": pattern_policy, "greedy": greedy_policy}
+
+
+# ------------------ ROLLOUT (SIMULATION) FUNCTION ------------------
+# Plays the simulation in place and takes every move back before returning
+def rollout(state, current_turn, root_player, max_rollout_steps=100, epsilon=0.3, policy=ROLLOUT_POLICY):
+    choose = ROLLOUT_POLICIES[policy]
     turn = current_turn
+    played = 0
     for _ in range(max_rollout_steps):
-        moves = list_possible_moves(state_sim, turn)
+        moves = legal_moves(state, turn)
         if not moves:
             break
 
         # Check for immediate win moves for the current player
-        immediate_win_moves = []
-        for move in moves:
-            next_state = apply_move(state_sim, move, turn)
-            is_term, score = is_terminal_state(next_state, root_player)
-            # If current player's move leads to immediate win for root or prevents opponent win
-            if is_term and ((turn == root_player and score > 0) or (turn != root_player and score < 0)):
-                immediate_win_moves.append(move)
+        immediate_win_moves = winning_moves(state, turn, moves)
         if immediate_win_moves:
             chosen_move = random.choice(immediate_win_moves)
         else:
-            # Epsilon-greedy: with probability epsilon choose random, else choose best move by evaluation
-            if random.random() < epsilon:
-                chosen_move = random.choice(moves)
-            else:
-                best_eval = -float('inf')
-                best_moves = []
-                for move in moves:
-                    next_state = apply_move(state_sim, move, turn)
-                    eval_score = evaluate_state(next_state, root_player)
-                    if eval_score > best_eval:
-                        best_eval = eval_score
-                        best_moves = [move]
-                    elif eval_score == best_eval:
-                        best_moves.append(move)
-                chosen_move = random.choice(best_moves) if best_moves else random.choice(moves)
-        
-        state_sim = apply_move(state_sim, chosen_move, turn)
+            chosen_move = choose(state, moves, turn, root_player, epsilon)
+
+        state.make_move(chosen_move, turn)
+        played += 1
         turn = 1 - turn
-        terminal, _ = is_terminal_state(state_sim, root_player)
-        if terminal:
+        if terminal_score(state, root_player) is not None:
             break
 
-    final_score = evaluate_state(state_sim, root_player)
+    final_score = evaluate_state(state, root_player)
+    for _ in range(played):
+        state.unmake_move()
     return root_player if final_score > 0 else 1 - root_player
 
 
-# ------------------ FIND BEST MOVE USING MCTS ------------------
-def best_move_mcts(state: GameState, player: int, iterations: int):
-    # Check for any immediate winning move
-    possible_moves = list_possible_moves(state, player)
-    immediate_wins = []
-    for move in possible_moves:
-        new_state = apply_move(state, move, player)
-        is_term, score = is_terminal_state(new_state, player)
-        if is_term and score > 0:
-            immediate_wins.append(move)
-    if immediate_wins:
-        return random.choice(immediate_wins)
+# Plays one rollout from each of the given positions and returns the winners. With NumPy the whole
+# batch is simulated at once by batch_playout (uniformly random moves, judged like rollout());
+# without it the positions are rolled out one by one with the given policy. NumPy is imported on the
+# first call rather than with this module, since it is optional and slow to import
+def rollout_batch(states, turns, root_player, max_rollout_steps=100, policy=ROLLOUT_POLICY):
+    try:
+        import batch_playout
+    except ImportError:
+        return [rollout(state, turn, root_player, max_rollout_steps, policy=policy) for state, turn in zip(states, turns)]
+    return batch_playout.play(states, turns, root_player, max_rollout_steps, seed=random.getrandbits(32)).tolist()
 
-    # Create the root node for MCTS
-    root = MCTSNode(state, parent=None, move=None, player_just_moved=None, next_player=player)
 
+# ------------------ FIND BEST MOVE USING MCTS ------------------
+# Runs the given number of iterations on the tree (state is the root position). Nodes only
+# keep their move code, so the position of a node is rebuilt by replaying moves from the root.
+# With leaf_batch > 1 every new leaf is simulated that many times in one rollout_batch() call.
+# Setting the cancel event stops the search after the current iteration. With stats None nothing is counted
+def grow_tree(tree: MCTSTree, state: GameState, player: int, iterations: int, stats, exploration=math.sqrt(2),
+              policy=ROLLOUT_POLICY, leaf_batch=1, cancel=None):
+    cells = state.topology.cells
+    visits, wins, moves = tree.visits, tree.wins, tree.moves
+    first_child, next_sibling = tree.first_child, tree.next_sibling
+    nodes_before = len(tree)
     for _ in range(iterations):
-        node = root
-        state_sim = copy.deepcopy(state)
+        if cancel is not None and cancel.is_set():
+            break
+        node = 0
         current_turn = player
+        depth = 0
 
         # 1. Selection: traverse the tree using UCT until a node with untried moves is found
-        while node.untried_moves == [] and node.children:
-            node = node.uct_select_child()
-            state_sim = apply_move(state_sim, node.move, current_turn)
+        while moves[node] != UNKNOWN and moves[node] and tree.children[node] == moves[node]:
+            parent_log = math.log(visits[node])
+            best_value = -float('inf')
+            child = first_child[node]
+            while child != NO_NODE:
+                value = wins[child] / visits[child] + exploration * math.sqrt(parent_log / visits[child])
+                if value > best_value:
+                    best_value = value
+                    node = child
+                child = next_sibling[child]
+            state.make_move(decode_move(tree.move[node], cells), current_turn)
+            depth += 1
             current_turn = 1 - current_turn
 
         # 2. Expansion: expand one untried move
-        if node.untried_moves:
-            move = random.choice(node.untried_moves)
-            state_sim = apply_move(state_sim, move, current_turn)
-            node = node.add_child(move, state_sim)
+        legal = legal_moves(state, current_turn)
+        moves[node] = len(legal)
+        if tree.children[node] < len(legal):
+            tried = {tree.move[child] for child in tree.child_nodes(node)}
+            untried = [move for move in legal if encode_move(move, cells) not in tried]
+            move = random.choice(untried)
+            state.make_move(move, current_turn)
+            depth += 1
+            node = tree.add_node(node, encode_move(move, cells))
             current_turn = 1 - current_turn
 
-        # 3. Simulation (Rollout) using the enhanced policy
-        simulation_winner = rollout(state_sim, current_turn, player)
+        # 3. Simulation (Rollout) using the chosen policy, unless the tablebase knows the result.
+        # The tablebase is probed once per new leaf, not on every rollout ply: it only covers the
+        # endgames near its seed games, so most positions a rollout goes through are not in it
+        known = None
+        if not state.stack[0] and not state.stack[1]:
+            known = endgame_winner(state, current_turn)
+            if stats is not None:
+                stats.tablebase_probes += 1
+                stats.tablebase_hits += known is not None
+        if known is not None:
+            winners = [known] * leaf_batch
+        elif leaf_batch > 1:
+            winners = rollout_batch([state] * leaf_batch, [current_turn] * leaf_batch, player, policy=policy)
+        else:
+            winners = [rollout(state, current_turn, player, policy=policy)]
+        if stats is not None and known is None:
+            stats.rollouts += len(winners)
+
+        # 4. Backpropagation: update nodes along the path. The move into a node at an odd
+        # depth was made by the root player, at an even depth by the opponent
+        mover = player if depth % 2 else 1 - player
+        while node != NO_NODE:
+            visits[node] += len(winners)
+            if node:
+                wins[node] += winners.count(mover)
+            mover = 1 - mover
+            node = tree.parent[node]
+
+        # Walk back up to the root position
+        for _ in range(depth):
+            state.unmake_move()
+        if stats is not None:
+            stats.iterations += 1
+    if stats is not None:
+        stats.nodes += len(tree) - nodes_before
+        stats.tree_nodes = len(tree)
+        stats.tree_bytes = tree.memory()
+
+
+# (visits, wins) of every root move of the tree
+def root_statistics(tree: MCTSTree, cells: int):
+    return {decode_move(tree.move[child], cells): (tree.visits[child], tree.wins[child]) for child in tree.child_nodes(0)}
+
+
+# Grows a new tree from state and returns the (visits, wins) of every root move
+def run_mcts(state: GameState, player: int, iterations: int, stats, policy=ROLLOUT_POLICY, leaf_batch=1, cancel=None):
+    tree = MCTSTree()
+    grow_tree(tree, state, player, iterations, stats, policy=policy, leaf_batch=leaf_batch, cancel=cancel)
+    return root_statistics(tree, state.topology.cells)
+
+
+# Runs in a worker process: an independent tree with its own random seed
+def mcts_worker(state: GameState, player: int, iterations: int, seed: int, policy=ROLLOUT_POLICY, leaf_batch=1,
+                collect_stats=True):
+    random.seed(seed)
+    stats = MCTSStats() if collect_stats else None
+    return run_mcts(state, player, iterations, stats, policy, leaf_batch), stats
+
+
+# With workers > 1 the iterations are split over independent trees built in the process pool
+# (root parallelisation) and their root statistics are added up before choosing. The cancel event
+# only stops a search in this process; cancelled before its first iteration, the search returns None
+def best_move_mcts(state: GameState, player: int, iterations: int, workers=1, stats=None, policy=ROLLOUT_POLICY, leaf_batch=1,
+                   use_book=True, cancel=None):
+    state = state.clone()
 
-        # 4. Backpropagation: update nodes along the path
-        while node is not None:
-            node.update(simulation_winner)
-            node = node.parent
+    # Check for any immediate winning move
+    possible_moves = legal_moves(state, player)
+    immediate_wins = winning_moves(state, player, possible_moves)
+    if immediate_wins:
+        return random.choice(immediate_wins)
+    if use_book:
+        move = book_move(state, player)
+        if move in possible_moves:
+            return move
+
+    start_time = time.perf_counter()
+    if workers > 1:
+        pool = parallel.get_pool(workers)
+        share = -(-iterations // workers)
+        futures = [pool.submit(mcts_worker, state, player, share, random.getrandbits(32), policy, leaf_batch, stats is not None)
+                   for _ in range(workers)]
+        children = {}
+        for future in futures:
+            worker_children, worker_stats = future.result()
+            for move, (visits, wins) in worker_children.items():
+                total_visits, total_wins = children.get(move, (0, 0))
+                children[move] = (total_visits + visits, total_wins + wins)
+            if stats is not None:
+                stats.merge(worker_stats)
+    else:
+        children = run_mcts(state, player, iterations, stats, policy, leaf_batch, cancel)
+    if stats is not None:
+        stats.elapsed += time.perf_counter() - start_time
 
     # Choose the child with the highest visit count
-    best_child = max(root.children, key=lambda child: child.visits)
-    return best_child.move
\ No newline at end of file
+    if not children:
+        return None
+    return max(children, key=lambda move: children[move][0])
+
+
+# ------------------ MCTS SESSION (TREE REUSE BETWEEN TURNS) ------------------
+# Keeps a bot's tree between its turns. The game records every move played, and the next
+# search re-roots onto the node those moves lead to, keeping the statistics of its subtree.
+# Between its turns the bot can also ponder: grow the tree of the position the opponent has to
+# play, whose subtree for the opponent's actual move is then reused by the next search
+class MCTSSession:
+    def __init__(self, player, policy=ROLLOUT_POLICY, leaf_batch=1):
+        self.player = player
+        self.policy = policy     # Rollout policy of the searches
+        self.leaf_batch = leaf_batch # Rollouts per new leaf (see grow_tree)
+        self.tree = None
+        self.root_state = None   # Position of the root node
+        self.root_turn = player  # Player to move at the root node
+        self.pending = []        # Moves played since the last search
+        self.carried_visits = 0  # Visits of the reused subtree in the last search
+
+    def record(self, move):
+        self.pending.append(move)
+
+    # Tree for a search from state with to_move to play: the matching subtree of the old tree, or a new one
+    def reroot(self, state: GameState, to_move: int):
+        tree = self.tree
+        node = NO_NODE
+        # The recorded moves must lead exactly to this position and side to move
+        if tree is not None and (self.root_turn + len(self.pending)) % 2 == to_move:
+            cells = state.topology.cells
+            replay = self.root_state.clone()
+            turn = self.root_turn
+            node = 0
+            for move in self.pending:
+                node = tree.find_child(node, encode_move(move, cells))
+                if node == NO_NODE:
+                    break
+                replay.make_move(move, turn)
+                turn = 1 - turn
+            if node != NO_NODE and (replay.occupancy != state.occupancy or replay.stack != state.stack):
+                node = NO_NODE
+
+        # Copy the reused subtree into fresh arrays so the rest of the old tree is freed
+        if node == NO_NODE:
+            self.tree = MCTSTree()
+        elif node != 0:
+            self.tree = tree.subtree(node)
+        self.root_state = state.clone()
+        self.root_turn = to_move
+        self.pending = []
+        self.carried_visits = self.tree.visits[0]
+        return self.tree
+
+    def best_move(self, state: GameState, iterations: int, stats=None, use_book=True, cancel=None):
+        state = state.clone()
+        tree = self.reroot(state, self.player)
+        if stats is not None:
+            stats.carried_visits += self.carried_visits
+
+        # Check for any immediate winning move
+        possible_moves = legal_moves(state, self.player)
+        immediate_wins = winning_moves(state, self.player, possible_moves)
+        if immediate_wins:
+            return random.choice(immediate_wins)
+        if use_book:
+            move = book_move(state, self.player)
+            if move in possible_moves:
+                return move
+
+        start_time = time.perf_counter()
+        grow_tree(tree, state, self.player, iterations, stats, policy=self.policy, leaf_batch=self.leaf_batch, cancel=cancel)
+        if stats is not None:
+            stats.elapsed += time.perf_counter() - start_time
+
+        # Choose the child with the highest visit count
+        children = root_statistics(tree, state.topology.cells)
+        if not children:
+            return None
+        return max(children, key=lambda move: children[move][0])
+
+    # Grows the tree of state, where the opponent is to move, by some iterations
+    def ponder(self, state: GameState, iterations: int, stats=None):
+        opponent = 1 - self.player
+        tree = self.reroot(state, opponent)
+        grow_tree(tree, state, opponent, iterations, stats, policy=self.policy, leaf_batch=self.leaf_batch)
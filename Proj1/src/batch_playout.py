@@ -0,0 +1,222 @@
+import numpy as np
+from gamestate import AXES, DIRECTIONS, get_topology
+
+# Vectorised playouts: a batch of positions is stored as NumPy arrays indexed by the create_graph()
+# cell ids and every board of the batch plays one uniformly random legal move per step.
+# owners[b, cell] is 0 or 1 for a piece, EMPTY for a free cell; the extra column at index `cells`
+# is OFF_BOARD and every precomputed ray is padded with it, so rays of any cell have the same length
+
+EMPTY = -1
+OFF_BOARD = -2
+VALUES = {1: 1, 2: 10, 3: 100, 4: 1000, 5: -10000} # Same piece values as evaluate_state()
+
+
+# ------------------ PRECOMPUTED TABLES ------------------
+class PlayoutTables:
+    def __init__(self, size):
+        topology = get_topology(size)
+        cells = topology.cells
+        self.size = size
+        self.cells = cells
+
+        # line_rays[cell, direction] lists the cells from cell outwards, padded with the off-board index.
+        # A ray has at most size - 1 cells, so the last entry is always off the board
+        self.line_rays = np.full((cells + 1, len(DIRECTIONS), size), cells, dtype=np.intp)
+        for cell_id in range(cells):
+            for direction, neighbors in enumerate(topology.neighbors):
+                step = 0
+                next_cell = neighbors[cell_id]
+                while next_cell >= 0:
+                    self.line_rays[cell_id, direction, step] = next_cell
+                    step += 1
+                    next_cell = neighbors[next_cell]
+
+        # slide_rays[player, cell, direction] are the sliding rays of the state (color rules applied)
+        self.slide_rays = np.full((2, cells + 1, len(DIRECTIONS), size), cells, dtype=np.intp)
+        for player in (0, 1):
+            for cell_id in range(cells):
+                for direction, ray in enumerate(topology.ray_cells[player][cell_id]):
+                    self.slide_rays[player, cell_id, direction, :len(ray)] = ray
+
+        self.corners = np.zeros(cells, dtype=bool)
+        self.corners[topology.corners] = True
+        self.axes = np.array(AXES)
+        # Piece value by longest line (lines longer than 5 are worth nothing, as in evaluate_state())
+        self.values = np.zeros(size + 1)
+        for length, value in VALUES.items():
+            if length <= size:
+                self.values[length] = value
+
+
+_tables = {}
+
+def get_tables(size):
+    if size not in _tables:
+        _tables[size] = PlayoutTables(size)
+    return _tables[size]
+
+
+# ------------------ BATCH OF POSITIONS ------------------
+class PlayoutBatch:
+    def __init__(self, states, turns):
+        size = states[0].size
+        self.tables = get_tables(size)
+        cells = self.tables.cells
+        count = len(states)
+
+        self.owners = np.full((count, cells + 1), EMPTY, dtype=np.int8)
+        self.owners[:, cells] = OFF_BOARD
+        self.stack = np.zeros((count, 2), dtype=np.int8)
+        self.turn = np.array(turns, dtype=np.int8)
+        self.last_player = np.full(count, -1, dtype=np.int8) # -1 before the first move
+        self.last_was_move = np.zeros(count, dtype=bool)
+        self.done = np.zeros(count, dtype=bool)              # Game over or no legal move
+
+        for b, state in enumerate(states):
+            for player in (0, 1):
+                occupancy = state.occupancy[player]
+                for cell_id in range(cells):
+                    if occupancy >> cell_id & 1:
+                        self.owners[b, cell_id] = player
+            self.stack[b] = state.stack
+            if state.last_player is not None:
+                self.last_player[b] = state.last_player
+            self.last_was_move[b] = state.last_type == "move"
+
+    # Longest line of own pieces through the given cell of every board, along any axis
+    def longest_through(self, rows, owners, cell, player):
+        tables = self.tables
+        rays = owners[rows[:, None, None], tables.line_rays[cell]]
+        runs = np.logical_and.accumulate(rays == player[:, None, None], axis=2).sum(axis=2)
+        return (1 + runs[:, tables.axes[:, 0]] + runs[:, tables.axes[:, 1]]).max(axis=1)
+
+    # Legal moves of the given boards as candidate flags: one per cell for placements, then one per
+    # (piece slot, direction, ray step) for movements. Returns the owners and turns of the boards, the
+    # cell of each piece slot, the sliding rays of the slots, the flags and the shape of the movements
+    def candidates(self, boards):
+        tables = self.tables
+        cells = tables.cells
+        count = len(boards)
+        index = np.arange(count)
+        owners = self.owners[boards]
+        turn = self.turn[boards]
+        own = owners[:, :cells] == turn[:, None]
+
+        # Placements: any free cell, but no corner while the player has no piece on the board
+        first = ~own.any(axis=1)
+        placements = (owners[:, :cells] == EMPTY) & (self.stack[boards, turn] > 0)[:, None]
+        placements &= ~(first[:, None] & tables.corners[None, :])
+
+        # Movements: the cells of each piece's sliding rays up to the first blocker. Flips can give a
+        # player more pieces than STACK_SIZE, so there is a slot per piece of the most crowded board;
+        # unused piece slots point at the off-board index
+        pieces = own.sum(axis=1)
+        slots = max(int(pieces.max()), 1)
+        origins = np.argsort(~own, axis=1, kind="stable")[:, :slots]
+        origins[np.arange(slots)[None, :] >= pieces[:, None]] = cells
+        rays = tables.slide_rays[turn[:, None], origins]
+        movements = np.logical_and.accumulate(owners[index[:, None, None, None], rays] == EMPTY, axis=3)
+
+        legal = np.concatenate((placements, movements.reshape(count, -1)), axis=1)
+        return owners, turn, origins, rays, legal, movements.shape[1:]
+
+    # Legal moves of every board as GameState moves, to check candidates() against the rules kernel
+    def legal_moves(self):
+        cells = self.tables.cells
+        owners, turn, origins, rays, legal, shape = self.candidates(np.arange(len(self.owners)))
+        moves = []
+        for b in range(len(legal)):
+            board_moves = []
+            for choice in np.flatnonzero(legal[b]):
+                if choice < cells:
+                    board_moves.append(("placement", int(choice)))
+                else:
+                    slot, direction, step = np.unravel_index(choice - cells, shape)
+                    board_moves.append(("move", int(origins[b, slot]), int(rays[b, slot, direction, step])))
+            moves.append(board_moves)
+        return moves
+
+    # One uniformly random legal move on every board still in play
+    def step(self, rng):
+        tables = self.tables
+        cells = tables.cells
+        boards = np.flatnonzero(~self.done)
+        if not len(boards):
+            return
+        count = len(boards)
+        index = np.arange(count)
+        owners, turn, origins, rays, legal, shape = self.candidates(boards)
+
+        # Uniform pick: the candidate at which the running count of legal ones passes a random rank
+        legal_count = legal.sum(axis=1)
+        stuck = legal_count == 0
+        self.done[boards[stuck]] = True
+        rank = (rng.random(count) * legal_count).astype(np.int32)
+        rank[stuck] = -1 # Picks candidate 0, which is then not played
+        choice = (legal.cumsum(axis=1, dtype=np.int32) <= rank[:, None]).sum(axis=1)
+
+        # Decode the chosen candidates
+        is_move = choice >= cells
+        slot, direction, step = np.unravel_index(np.where(is_move, choice - cells, 0), shape)
+        origin = np.where(is_move, origins[index, slot], cells)
+        dest = np.where(is_move, rays[index, slot, direction, step], choice)
+
+        # Play them (boards without a legal move keep their position)
+        playing = ~stuck
+        index, turn, origin, dest, is_move = index[playing], turn[playing], origin[playing], dest[playing], is_move[playing]
+        owners[index[is_move], origin[is_move]] = EMPTY
+        owners[index, dest] = turn
+        placed = boards[playing][~is_move]
+        self.stack[placed, turn[~is_move]] -= 1
+
+        # Flips: a run of enemy pieces from the destination closed by an own piece (movements only)
+        line = tables.line_rays[dest]
+        values = owners[index[:, None, None], line]
+        run = np.logical_and.accumulate(values == 1 - turn[:, None, None], axis=2).sum(axis=2)
+        closing = np.take_along_axis(values, run[:, :, None], axis=2)[:, :, 0]
+        flipping = (run > 0) & (closing == turn[:, None]) & is_move[:, None]
+        flipped = flipping[:, :, None] & (np.arange(tables.size)[None, None, :] < run[:, :, None])
+        flip_boards = np.broadcast_to(index[:, None, None], flipped.shape)[flipped]
+        owners[flip_boards, line[flipped]] = np.broadcast_to(turn[:, None, None], flipped.shape)[flipped]
+
+        # Game over: a line of 5+ through the landing cell loses, exactly 4 made by a movement wins
+        longest = self.longest_through(index, owners, dest, turn)
+        finished = (longest >= 5) | ((longest == 4) & is_move)
+
+        played = boards[playing]
+        self.owners[played] = owners[index]
+        self.last_player[played] = turn
+        self.last_was_move[played] = is_move
+        self.turn[played] = 1 - turn
+        self.done[played[finished]] = True
+
+    # evaluate_state() of every board from the point of view of root_players
+    def evaluate(self, root_players):
+        tables = self.tables
+        cells = tables.cells
+        owners = self.owners[:, :cells]
+        count = len(owners)
+        rays = self.owners[np.arange(count)[:, None, None, None], tables.line_rays[None, :cells]]
+        runs = np.logical_and.accumulate(rays == owners[:, :, None, None], axis=3).sum(axis=3)
+        longest = (1 + runs[:, :, tables.axes[:, 0]] + runs[:, :, tables.axes[:, 1]]).max(axis=2)
+        # Every piece scores its line value plus one, for its owner
+        piece_values = tables.values[np.minimum(longest, tables.size)] + 1
+        sign = np.where(owners == root_players[:, None], 1, np.where(owners == EMPTY, 0, -1))
+        score = (piece_values * sign).sum(axis=1)
+
+        last_action = np.where(self.last_was_move, 0.5, -0.2)
+        return score + np.where(self.last_player == root_players, last_action, -last_action)
+
+
+# ------------------ PLAYOUTS ------------------
+# Plays up to max_steps random plies on every position and returns the winner of each playout,
+# judged like rollout() by the evaluation of the final position
+def play(states, turns, root_player, max_steps=100, seed=None):
+    rng = np.random.default_rng(seed)
+    batch = PlayoutBatch(states, turns)
+    for _ in range(max_steps):
+        if batch.done.all():
+            break
+        batch.step(rng)
+    root_players = np.full(len(states), root_player, dtype=np.int8)
+    return np.where(batch.evaluate(root_players) > 0, root_players, 1 - root_players)
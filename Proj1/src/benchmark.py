@@ -0,0 +1,383 @@
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from gamestate import GameState, STACK_SIZE, iter_bits, popcount
+from threats import winning_moves
+from transposition import TranspositionTable
+from tournament import parse_config, play_game
+import algorithm as alg
+import rules
+
+
+# ------------------ TEST POSITIONS ------------------
+# Positions reached by random play from the empty board (the same for a given seed)
+def random_positions(size, count, seed=0, max_plies=30):
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        state = GameState(size)
+        turn = 0
+        for _ in range(rng.randrange(max_plies)):
+            moves = alg.list_possible_moves(state, turn)
+            if not moves:
+                break
+            state.make_move(rng.choice(moves), turn)
+            if alg.terminal_score(state, turn) is not None:
+                state.unmake_move()
+                break
+            turn = 1 - turn
+        positions.append((state.clone(), turn))
+    return positions
+
+
+# Positions where the player to move has more pieces on the board than STACK_SIZE, which only flips
+# make possible (random play, the same for a given seed)
+def crowded_positions(size, count, seed=0, max_games=2000):
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(max_games):
+        state = GameState(size)
+        turn = 0
+        for _ in range(100):
+            moves = alg.list_possible_moves(state, turn)
+            if not moves:
+                break
+            state.make_move(rng.choice(moves), turn)
+            if alg.terminal_score(state, turn) is not None:
+                break
+            turn = 1 - turn
+            if popcount(state.occupancy[turn]) > STACK_SIZE:
+                positions.append((state.clone(), turn))
+                break
+        if len(positions) == count:
+            break
+    return positions
+
+
+# ------------------ REFERENCE MOVE GENERATION ------------------
+# The recursive cell by cell walk used before the precomputed rays, kept to compare against
+def recursive_direction(state, current_cell, player, color_switched, direction):
+    moves = []
+    next_cell = state.topology.neighbors[direction][current_cell]
+
+    if next_cell < 0 or state.occupied() >> next_cell & 1:
+        return moves
+
+    types = state.topology.types
+    correct_color = state.topology.color_masks[player] >> next_cell & 1
+
+    if types[current_cell] == types[next_cell]:
+        moves.append(next_cell)
+        if correct_color:
+            moves.extend(recursive_direction(state, next_cell, player, color_switched, direction))
+    elif not color_switched:
+        moves.append(next_cell)
+        if correct_color:
+            moves.extend(recursive_direction(state, next_cell, player, True, direction))
+
+    return moves
+
+
+def reference_moves(state, player):
+    moves = []
+    for origin in iter_bits(state.occupancy[player]):
+        for direction in range(6):
+            for dest in recursive_direction(state, origin, player, False, direction):
+                moves.append(("move", origin, dest))
+    return moves
+
+
+def ray_moves(state, player):
+    moves = []
+    for origin in iter_bits(state.occupancy[player]):
+        for dest in iter_bits(state.destination_mask(origin, player)):
+            moves.append(("move", origin, dest))
+    return moves
+
+
+# ------------------ MOVE GENERATION BENCHMARK ------------------
+def bench_movegen(size, count=200, repeat=20, seed=0):
+    positions = random_positions(size, count, seed)
+
+    # Both generators must agree before their speed means anything
+    for state, turn in positions:
+        for player in (0, 1):
+            if sorted(reference_moves(state, player)) != sorted(ray_moves(state, player)):
+                raise AssertionError(f"move generators disagree on a SIZE {size} position")
+
+    result = {"size": size, "positions": count}
+    for name, generator in (("recursive", reference_moves), ("rays", ray_moves)):
+        generated = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for state, turn in positions:
+                generated += len(generator(state, turn))
+        elapsed = time.perf_counter() - start
+        result[name + "_moves_per_second"] = generated / elapsed
+    result["speedup"] = result["rays_moves_per_second"] / result["recursive_moves_per_second"]
+    return result
+
+
+# ------------------ MCTS SCALING BENCHMARK ------------------
+# Iterations per second of root-parallel MCTS for each worker count
+def bench_mcts_scaling(size, workers_list, iterations=400, seed=0):
+    # A position without an immediate win, which would skip the search
+    state, turn = next((state, turn) for state, turn in random_positions(size, 50, seed, max_plies=12)
+                       if not winning_moves(state, turn, alg.list_possible_moves(state, turn)))
+    results = []
+    for workers in workers_list:
+        stats = alg.MCTSStats()
+        alg.best_move_mcts(state, turn, iterations, workers=workers, stats=stats, use_book=False)
+        results.append({"size": size, "workers": workers, **stats.report()})
+    return results
+
+
+# ------------------ ROLLOUT POLICY BENCHMARK ------------------
+# Playouts per second of every rollout policy, and its score (wins + half the draws) as the MCTS
+# policy against an MCTS using the greedy policy with the same number of iterations
+def bench_rollouts(size, count=50, games=10, iterations=100, seed=0):
+    positions = random_positions(size, count, seed, max_plies=12)
+    results = []
+    for policy in alg.ROLLOUT_POLICIES:
+        random.seed(seed)
+        start = time.perf_counter()
+        for state, turn in positions:
+            alg.rollout(state, turn, turn, policy=policy)
+        result = {"size": size, "policy": policy, "playouts_per_second": count / (time.perf_counter() - start)}
+
+        if games and policy != "greedy":
+            config = parse_config(f"mcts:iterations={iterations},policy={policy},book=0")
+            greedy = parse_config(f"mcts:iterations={iterations},policy=greedy,book=0")
+            score = 0.0
+            for game in range(games):
+                # Alternate who starts
+                first = game % 2
+                winner = play_game(size, [config, greedy] if first == 0 else [greedy, config], seed + game)["winner"]
+                score += 0.5 if winner is None else winner == first
+            result["score_vs_greedy"] = score / games
+        results.append(result)
+    return results
+
+
+# ------------------ BATCHED PLAYOUT BENCHMARK ------------------
+# Playouts per second of the NumPy batch engine for each batch size, next to one-at-a-time
+# uniformly random rollouts from the same positions
+def bench_batch_playouts(size, batch_sizes, count=20, seed=0):
+    import batch_playout
+
+    positions = random_positions(size, count, seed, max_plies=12)
+
+    # The batch engine must generate the same moves as the state, crowded boards included
+    checked = positions + random_positions(size, count, seed) + crowded_positions(size, count, seed)
+    batch = batch_playout.PlayoutBatch([state for state, turn in checked], [turn for state, turn in checked])
+    for (state, turn), moves in zip(checked, batch.legal_moves()):
+        if sorted(moves) != sorted(alg.list_possible_moves(state, turn)):
+            raise AssertionError(f"batch playouts and GameState disagree on a SIZE {size} position")
+
+    random.seed(seed)
+    start = time.perf_counter()
+    for state, turn in positions:
+        alg.rollout(state, turn, turn, policy="random")
+    results = [{"size": size, "batch": 1, "playouts_per_second": count / (time.perf_counter() - start)}]
+
+    for batch in batch_sizes:
+        start = time.perf_counter()
+        for state, turn in positions:
+            alg.rollout_batch([state] * batch, [turn] * batch, turn)
+        results.append({"size": size, "batch": batch, "playouts_per_second": count * batch / (time.perf_counter() - start)})
+    return results
+
+
+# ------------------ BENCHMARK SUITE ------------------
+# Fixed positions, perft counts to check move generation and machine-readable speed figures, so
+# two runs (before and after a change) can be compared number by number
+
+LOG_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_logs")
+LOGGED_MOVE = re.compile(r"Player (\d) (?:placed at cell (\d+)|moved from cell (\d+) to (\d+))")
+
+
+# Positions of the logged games of a SIZE, every `step` plies. The replay of a game stops at a move
+# the rules reject, since the older logs were written by earlier versions of the GUI
+def log_positions(size, folder=LOG_FOLDER, step=4):
+    positions = []
+    if not os.path.isdir(folder):
+        return positions
+    for filename in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, filename)) as file:
+            text = file.read()
+        if f"Board Size: {size}\n" not in text:
+            continue
+        state = GameState(size)
+        for ply, match in enumerate(LOGGED_MOVE.finditer(text)):
+            player = int(match.group(1)) - 1
+            if match.group(2) is not None:
+                move = ("placement", int(match.group(2)))
+            else:
+                move = ("move", int(match.group(3)), int(match.group(4)))
+            if move not in alg.list_possible_moves(state, player):
+                break
+            if ply % step == 0:
+                positions.append((f"{filename}:{ply}", state.clone(), player))
+            state.make_move(move, player)
+            if alg.terminal_score(state, player) is not None:
+                break
+    return positions
+
+
+# The empty board, a few random positions and the logged positions, as (name, state, turn)
+def suite_positions(size, seed=0):
+    positions = [("empty", GameState(size), 0)]
+    positions += [(f"random:{i}", state, turn) for i, (state, turn) in enumerate(random_positions(size, 4, seed))]
+    return positions + log_positions(size)
+
+
+# Number of move sequences of the given length; a finished game is not played further
+def perft(state, player, depth):
+    moves = alg.list_possible_moves(state, player)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        state.make_move(move, player)
+        if alg.terminal_score(state, player) is not None:
+            nodes += 1
+        else:
+            nodes += perft(state, 1 - player, depth - 1)
+        state.unmake_move()
+    return nodes
+
+
+def run_suite(size, perft_depth=3, search_depth=3, mcts_iterations=200, repeat=20, seed=0):
+    positions = suite_positions(size, seed)
+    result = {"size": size, "positions": len(positions)}
+
+    # Perft counts per position and depth (they only change if the rules or move generation do).
+    # Every timed section starts from an empty legal-move cache, so its figures do not depend on the
+    # positions an earlier section happened to leave in it
+    result["perft"] = {}
+    elapsed = 0.0
+    for name, state, turn in positions:
+        rules.move_cache.clear()
+        start = time.perf_counter()
+        result["perft"][name] = [perft(state, turn, depth) for depth in range(1, perft_depth + 1)]
+        elapsed += time.perf_counter() - start
+    nodes = sum(sum(counts) for counts in result["perft"].values())
+    result["perft_nodes_per_second"] = nodes / elapsed
+
+    # Move generation itself, without the cache; then the same lists read from the cache
+    generated = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, state, turn in positions:
+            generated += len(rules.generate_moves(state, turn))
+    result["moves_per_second"] = generated / (time.perf_counter() - start)
+
+    rules.move_cache.clear()
+    generated = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, state, turn in positions:
+            generated += len(rules.legal_moves(state, turn))
+    result["cached_moves_per_second"] = generated / (time.perf_counter() - start)
+
+    # Minimax at fixed depths, every position searched with an empty transposition table
+    table = TranspositionTable()
+    result["minimax"] = []
+    for depth in range(1, search_depth + 1):
+        stats = alg.SearchStats()
+        elapsed = 0.0
+        for name, state, turn in positions:
+            table.clear()
+            rules.move_cache.clear()
+            start = time.perf_counter()
+            alg.best_move(state, turn, depth, table=table, stats=stats, use_book=False)
+            elapsed += time.perf_counter() - start
+        result["minimax"].append({"depth": depth, "nodes": stats.nodes, "cutoffs": stats.cutoffs,
+                                  "nodes_per_second": stats.nodes / elapsed})
+
+    random.seed(seed)
+    stats = alg.MCTSStats()
+    for name, state, turn in positions[:5]:
+        rules.move_cache.clear()
+        alg.best_move_mcts(state, turn, mcts_iterations, stats=stats, use_book=False)
+    report = stats.report()
+    result["mcts"] = {key: report[key] for key in ("iterations", "iterations_per_second", "bytes_per_node")}
+
+    # Peak memory of one search from the empty board, measured apart since tracemalloc slows everything
+    name, state, turn = positions[0]
+    tracemalloc.start()
+    alg.best_move(state, turn, search_depth, table=TranspositionTable(), use_book=False)
+    result["minimax_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    alg.best_move_mcts(state, turn, mcts_iterations, use_book=False)
+    result["mcts_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+# ------------------ IMPORT TIME ------------------
+# Seconds to import a module in a fresh interpreter, and whether that pulled in pygame
+def bench_import_time(module="engine"):
+    code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start, 'pygame' in sys.modules)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    return {"module": module, "seconds": float(output[0]), "imports_pygame": output[1] == "True"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yonmoque-Hex engine benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 7, 9])
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mcts-workers", type=int, nargs="+", help="also measure MCTS iterations/s for these worker counts")
+    parser.add_argument("--rollout-games", type=int, help="also compare the rollout policies, playing this many games each")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", help="also measure batched playouts/s for these batch sizes")
+    parser.add_argument("--suite", action="store_true", help="run the benchmark suite instead and print it as JSON")
+    parser.add_argument("--output", help="write the suite JSON to this file instead of printing it")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = {"python": platform.python_version(), "import": bench_import_time(),
+                   "sizes": [run_suite(size, seed=args.seed) for size in args.sizes]}
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        return
+
+    result = bench_import_time()
+    print(f"import engine: {result['seconds'] * 1000:.0f} ms, pygame {'loaded' if result['imports_pygame'] else 'not loaded'}")
+
+    for size in args.sizes:
+        result = bench_movegen(size, args.positions, seed=args.seed)
+        print(f"SIZE {size}: recursive {result['recursive_moves_per_second']:,.0f} moves/s, "
+              f"rays {result['rays_moves_per_second']:,.0f} moves/s ({result['speedup']:.1f}x)")
+
+        if args.mcts_workers:
+            for result in bench_mcts_scaling(size, args.mcts_workers, seed=args.seed):
+                print(f"SIZE {size}: MCTS with {result['workers']} worker(s) {result['iterations_per_second']:,.0f} iterations/s, "
+                      f"{result['bytes_per_node']:.0f} bytes/node")
+
+        if args.rollout_games is not None:
+            for result in bench_rollouts(size, games=args.rollout_games, seed=args.seed):
+                line = f"SIZE {size}: {result['policy']} rollouts {result['playouts_per_second']:,.0f} playouts/s"
+                if "score_vs_greedy" in result:
+                    line += f", score {result['score_vs_greedy']:.0%} against greedy"
+                print(line)
+
+        if args.batch_sizes:
+            for result in bench_batch_playouts(size, args.batch_sizes, seed=args.seed):
+                print(f"SIZE {size}: batches of {result['batch']} {result['playouts_per_second']:,.0f} playouts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import pygame
 import math
+from functools import partial
 
 
 # Screen settings
@@ -10,7 +11,10 @@ HEX_RADIUS = (WIDTH - 200) // (SIZE + (SIZE - 1 // 2)) / 2
 BG_COLOR = (255, 255, 255) # Background Color
 NEUTRAL, WHITE, BLUE = 0, 1, 2 # Types of cells
 COLORS = [(255, 165, 0), (255, 255, 255), (173, 216, 230)] # Colors of the cells
+HOVER_COLOR = (148, 0, 211) # Outline of the cell under the mouse: dark violet stands out on every cell color
 DIRECTIONS = ["UP", "UP_RIGHT", "DOWN_RIGHT", "DOWN", "DOWN_LEFT", "UP_LEFT"] # Possible directions of movement
+HEX_CORNERS = [(math.cos(math.pi / 3 * i), math.sin(math.pi / 3 * i)) for i in range(6)] # Unit offsets of the corners
+BOARD_ORIGIN = (400, 200) # Center of cell 0
 
 # Screen with title
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -77,62 +81,164 @@ def create_graph():
     
     
     # Set the positions of the cells
-    row_pos = [400, 200]
-    
-    for i in range(SIZE):
-        col_pos = row_pos.copy()
-        for d in range(SIZE):
-            cells[i * SIZE + d].pos = (col_pos[0], col_pos[1])
-            col_pos[0] += HEX_RADIUS * 1.5
-            col_pos[1] += HEX_RADIUS * math.sqrt(3) / 2
-        row_pos[0] -= HEX_RADIUS * 1.5
-        row_pos[1] += HEX_RADIUS * math.sqrt(3) / 2
+    for cell in cells:
+        cell.pos = cell_position(cell.id)
         
     graph = cells
 
     return cells
+
+
+# ------------------ CELL COORDINATES ------------------
+# Cell (row, column) = divmod(id, SIZE) is drawn at a regular hexagonal grid position: each column
+# step moves (1.5 R, R sqrt(3) / 2) and each row step (-1.5 R, R sqrt(3) / 2) from BOARD_ORIGIN.
+# In axial coordinates of flat-topped hexagons that is q = column - row, r = row, so a pixel is
+# mapped back to its cell by inverting the layout and rounding to the nearest hexagon
+def cell_position(cell_id):
+    row, column = divmod(cell_id, SIZE)
+    return (BOARD_ORIGIN[0] + HEX_RADIUS * 1.5 * (column - row),
+            BOARD_ORIGIN[1] + HEX_RADIUS * math.sqrt(3) / 2 * (column + row))
+
+
+# Id of the cell whose hexagon contains the pixel, None outside the board
+def cell_at(x, y):
+    q = (x - BOARD_ORIGIN[0]) / (HEX_RADIUS * 1.5)
+    r = (y - BOARD_ORIGIN[1]) / (HEX_RADIUS * math.sqrt(3)) - q / 2
+
+    # Cube rounding: round the three coordinates and fix the one that moved the most
+    s = -q - r
+    rq, rr, rs = round(q), round(r), round(s)
+    dq, dr, ds = abs(rq - q), abs(rr - r), abs(rs - s)
+    if dq > dr and dq > ds:
+        rq = -rr - rs
+    elif dr > ds:
+        rr = -rq - rs
+
+    row, column = rr, rq + rr
+    if 0 <= row < SIZE and 0 <= column < SIZE:
+        return row * SIZE + column
+    return None
         
 
 
-# Draws an hexagon
-def draw_hexagon(x, y, type, HEX_RADIUS, highlighted, hint=False):
-    points = []
-    for i in range(6):
-        angle = math.pi / 3 * i
-        px = x + HEX_RADIUS * math.cos(angle)
-        py = y + HEX_RADIUS * math.sin(angle)
-        points.append((px, py))
+# ------------------ TEXT ------------------
+# Fonts and rendered texts are kept instead of being created again every frame
+_fonts = {}
+_texts = {}
+
+def get_font(size):
+    if size not in _fonts:
+        _fonts[size] = pygame.font.Font(None, size)
+    return _fonts[size]
+
+
+def render_text(text, size, color=(0, 0, 0)):
+    key = (text, size, color)
+    if key not in _texts:
+        if len(_texts) >= 256: # Progress messages change every frame
+            _texts.clear()
+        _texts[key] = get_font(size).render(text, True, color)
+    return _texts[key]
+
+
+# ------------------ DRAWING ------------------
+# Draws an hexagon (on the screen unless another surface is given)
+def draw_hexagon(x, y, type, HEX_RADIUS, highlighted, hint=False, surface=None, hovered=False):
+    surface = surface or screen
+    points = [(x + HEX_RADIUS * dx, y + HEX_RADIUS * dy) for dx, dy in HEX_CORNERS]
     
     # Draw an hexagon with a black outline
-    pygame.draw.polygon(screen, COLORS[type], points, 0)
-    # If a hint is active, draw a red border; else if highlighted, draw cyan; else black
+    pygame.draw.polygon(surface, COLORS[type], points, 0)
+    # If a hint is active, draw a red border; else if highlighted, draw cyan; else if under the mouse, violet; else black
     if hint:
-        pygame.draw.polygon(screen, (255, 0, 0), points, 3)
+        pygame.draw.polygon(surface, (255, 0, 0), points, 3)
     elif highlighted:
-        pygame.draw.polygon(screen, (0, 255, 255), points, 2)
+        pygame.draw.polygon(surface, (0, 255, 255), points, 2)
+    elif hovered:
+        pygame.draw.polygon(surface, HOVER_COLOR, points, 3)
     else:
-        pygame.draw.polygon(screen, (0, 0, 0), points, 2)
+        pygame.draw.polygon(surface, (0, 0, 0), points, 2)
     
     if type == NEUTRAL:
-        font = pygame.font.Font(None, 24)
-        text_surface = font.render("N", True, (0, 0, 0))
+        text_surface = render_text("N", 24)
         text_rect = text_surface.get_rect(center=(x, y))
 
-        screen.blit(text_surface, text_rect)
+        surface.blit(text_surface, text_rect)
+
+
+_board_layers = {}
+
+# Background and every hexagon without highlights or hints, drawn once per SIZE
+def board_layer():
+    if SIZE not in _board_layers:
+        layer = pygame.Surface((WIDTH, HEIGHT))
+        layer.fill(BG_COLOR)
+        for cell in graph:
+            x, y = cell.pos
+            draw_hexagon(x, y, cell.type, HEX_RADIUS, False, surface=layer)
+        _board_layers[SIZE] = layer
+    return _board_layers[SIZE]
+
+
+# Cells drawn over the board layer: hints, then highlighted cells. An item is (key, rect, draw):
+# the key describes how it looks, the rect bounds it and draw() puts it on the screen
+def cell_items(hovered=None):
+    items = []
+    cells = (cell for cell in graph if cell.hint or cell.highlighted or cell.id == hovered)
+    for cell in sorted(cells, key=lambda cell: cell.highlighted):
+        x, y = cell.pos
+        is_hovered = cell.id == hovered
+        rect = pygame.Rect(0, 0, 2 * HEX_RADIUS + 6, 2 * HEX_RADIUS + 6)
+        rect.center = (x, y)
+        draw = partial(draw_hexagon, x, y, cell.type, HEX_RADIUS, cell.highlighted, cell.hint, hovered=is_hovered)
+        items.append((("cell", cell.id, cell.highlighted, cell.hint, is_hovered), rect, draw))
+    return items
+
+
+# Item of a line of text centered horizontally on midtop
+def text_item(text, size, midtop):
+    surface = render_text(text, size)
+    rect = surface.get_rect(midtop=midtop)
+    return ("text", text, size, midtop), rect, partial(screen.blit, surface, rect)
 
 
 # Draw the board (highlighted cells last)
 def draw_graph():
-    
-    for cell in graph:
-        if cell.highlighted == False:
-            x, y = cell.pos
-            draw_hexagon(x, y, cell.type, HEX_RADIUS, cell.highlighted, cell.hint)
-            
-    for cell in graph:
-        if cell.highlighted == True:
-            x, y = cell.pos
-            draw_hexagon(x, y, cell.type, HEX_RADIUS, cell.highlighted, cell.hint)
+    screen.blit(board_layer(), (0, 0))
+    for key, rect, draw in cell_items():
+        draw()
+
+
+# Draws frames of items over the board layer. A frame whose items are the same as the last one's is
+# not drawn at all; otherwise the frame is composed again over the cached board layer, which is
+# cheap, and only the rects of the items that appeared or disappeared are sent to the display
+class FrameRenderer:
+    def __init__(self):
+        self.previous = None # Key -> rect of the items of the last frame
+        self.layer = None
+
+    # Next frame redraws the whole window (something else was drawn on it)
+    def invalidate(self):
+        self.previous = None
+
+    def render(self, items):
+        layer = board_layer()
+        current = {key: rect for key, rect, draw in items}
+        full = self.previous is None or layer is not self.layer
+        if not full:
+            dirty = [rect for key, rect in self.previous.items() if key not in current]
+            dirty += [rect for key, rect in current.items() if key not in self.previous]
+            if not dirty:
+                return
+        screen.blit(layer, (0, 0))
+        for key, rect, draw in items:
+            draw()
+        if full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        self.previous = current
+        self.layer = layer
 
 
 def clear_hints():
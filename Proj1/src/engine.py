@@ -0,0 +1,20 @@
+from gamestate import GameState, get_topology, encode_move, decode_move, STACK_SIZE
+from algorithm import (list_possible_moves, apply_move, evaluate_state, best_move, best_move_mcts,
+                       ROLLOUT_POLICY, ROLLOUT_POLICIES,
+                       MCTSSession, MCTSStats, SearchStats)
+from rules import legal_moves, is_legal, piece_destinations, terminal_score, winner, move_cache
+from threats import winning_moves, losing_moves
+from opening_book import book_move
+from ponder import Ponderer
+from search_worker import SearchWorker, SearchJob
+
+# Headless engine: rules, positions and search without any pygame import. Scripts that only need
+# the AI (benchmarks, tournaments) import this module, and the GUI is a client of it as well.
+# NumPy (batched rollouts) and the process pool (parallel searches) are only imported when used
+
+
+# ------------------ RULES ------------------
+# Legal moves and the end of the game come from the rules kernel (rules.py), shared with the GUI
+# Mask of the enemy pieces flipped by a piece of player landing on cell_id
+def flips(state: GameState, cell_id: int, player: int):
+    return state.flips(cell_id, player)
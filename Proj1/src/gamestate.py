@@ -0,0 +1,398 @@
+import math
+import random
+
+# Compact position representation used by the search algorithms.
+# Cells are identified by the same ids create_graph() assigns (row * SIZE + col),
+# so cell i of the board corresponds to bit i of every mask below.
+
+NEUTRAL, WHITE, BLUE = 0, 1, 2 # Types of cells
+DIRECTIONS = ["UP", "UP_RIGHT", "DOWN_RIGHT", "DOWN", "DOWN_LEFT", "UP_LEFT"] # Possible directions of movement
+AXES = [(0, 3), (1, 4), (5, 2)] # Pairs of opposite directions (UP/DOWN, UP_RIGHT/DOWN_LEFT, UP_LEFT/DOWN_RIGHT)
+STACK_SIZE = 6 # Pieces each player starts with
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+# Iterate over the cell ids set in a mask
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# ------------------ MOVE CODES ------------------
+# Compact int for a move: the cell id for a placement, cells + origin * cells + destination for a movement
+def encode_move(move, cells):
+    if move[0] == "placement":
+        return move[1]
+    return cells + move[1] * cells + move[2]
+
+
+def decode_move(code, cells):
+    if code < cells:
+        return ("placement", code)
+    origin, destination = divmod(code - cells, cells)
+    return ("move", origin, destination)
+
+
+# ------------------ BOARD TOPOLOGY ------------------
+# Everything that never changes after create_graph(): adjacency and cell colors
+class Topology:
+    def __init__(self, size):
+        self.size = size
+        self.cells = size * size
+        self.full = (1 << self.cells) - 1
+
+        # neighbors[direction][cell] is the id of the neighbor or -1
+        self.neighbors = [[-1] * self.cells for _ in DIRECTIONS]
+        up, up_right, down_right, down, down_left, up_left = self.neighbors
+        for i in range(self.cells):
+            if i % size != 0:  # Not first column
+                down_right[i - 1] = i
+                up_left[i] = i - 1
+            if i >= size:  # Not first row
+                down_left[i - size] = i
+                up_right[i] = i - size
+            if i >= size + 1 and i % size != 0:  # Not first column and not first row
+                down[i - size - 1] = i
+                up[i] = i - size - 1
+
+        # Same coloring as create_graph()
+        types = [WHITE] * self.cells
+        for i in range(size):
+            types[i] = BLUE
+            types[self.cells - i - 1] = BLUE
+            types[i * size - 1] = BLUE
+            types[i * size] = BLUE
+        self.corners = [0, size - 1, self.cells - size, self.cells - 1]
+        for i in self.corners + [self.cells // 2]:
+            types[i] = NEUTRAL
+        self.types = types
+
+        self.type_masks = [0, 0, 0]
+        for i, cell_type in enumerate(types):
+            self.type_masks[cell_type] |= 1 << i
+        self.corner_mask = sum(1 << i for i in self.corners)
+        # Cells a player keeps sliding over (player 0 -> blue, player 1 -> white)
+        self.color_masks = [self.type_masks[BLUE], self.type_masks[WHITE]]
+
+        # Precomputed sliding rays, for each player, cell and direction: the cells a piece could reach
+        # in order on an empty board. The color rules are already applied (a ray ends on a cell that is
+        # not of the player's color or right before a second color switch), so generating moves only
+        # has to cut each ray at its first occupied cell
+        self.ray_cells = [[[self.walk_ray(cell_id, player, direction) for direction in range(len(DIRECTIONS))]
+                           for cell_id in range(self.cells)] for player in (0, 1)]
+        # Same rays as (mask, ascending ids) pairs, leaving out the empty ones
+        self.rays = [[[(sum(1 << i for i in ray), ray[0] > cell_id) for ray in cell_rays if ray]
+                      for cell_id, cell_rays in enumerate(player_rays)] for player_rays in self.ray_cells]
+
+        # Tables for cheap move patterns: the cells next to every cell, and for each direction the
+        # (enemy cell, own cell) pair that a piece landing on the cell flips a single piece between
+        self.adjacent = [sum(1 << neighbors[i] for neighbors in self.neighbors if neighbors[i] >= 0)
+                         for i in range(self.cells)]
+        self.sandwiches = [[(1 << neighbors[i], 1 << neighbors[neighbors[i]]) for neighbors in self.neighbors
+                            if neighbors[i] >= 0 and neighbors[neighbors[i]] >= 0] for i in range(self.cells)]
+
+        # Zobrist keys, seeded by the board size so hashes are the same between runs
+        rng = random.Random(size)
+        self.zobrist_cells = [[rng.getrandbits(64) for _ in range(self.cells)] for _ in range(2)]
+        self.zobrist_stack = [[rng.getrandbits(64) for _ in range(STACK_SIZE + 1)] for _ in range(2)]
+        self.zobrist_turn = [rng.getrandbits(64) for _ in range(2)]
+        self.zobrist_root = [rng.getrandbits(64) for _ in range(2)]
+
+
+    def walk_ray(self, cell_id, player, direction):
+        neighbors = self.neighbors[direction]
+        types = self.types
+        own_color = self.color_masks[player]
+        ray = []
+        current = cell_id
+        color_switched = False
+        while True:
+            next_cell = neighbors[current]
+            if next_cell < 0:
+                break
+            if types[current] != types[next_cell]:
+                if color_switched:
+                    break
+                color_switched = True
+            ray.append(next_cell)
+            # Only cells of the player's color let the piece keep sliding
+            if not own_color >> next_cell & 1:
+                break
+            current = next_cell
+        return tuple(ray)
+
+
+_topologies = {}
+
+def get_topology(size):
+    if size not in _topologies:
+        _topologies[size] = Topology(size)
+    return _topologies[size]
+
+
+# ------------------ GAME STATE CLASS ------------------
+class GameState:
+    def __init__(self, size, occupancy=(0, 0), stack=(STACK_SIZE, STACK_SIZE)):
+        self.size = size
+        self.topology = get_topology(size)
+        self.occupancy = list(occupancy)  # Bitmask of the cells owned by each player
+        self.stack = list(stack)          # Pieces left to place for each player
+        self.last_player = None           # Information about the last move
+        self.last_type = None
+        self.last_cell = None
+        self.history = []                 # Undo entries of the moves made in place
+        self.hash = self.compute_hash()   # Zobrist hash of the pieces and stacks
+        self.reset_lines()
+
+    # Build the search state from the pygame board (GUI boundary)
+    @classmethod
+    def from_board(cls, cells, stack):
+        occupancy = [0, 0]
+        for cell in cells:
+            if cell.piece is not None:
+                occupancy[cell.piece.player] |= 1 << cell.id
+        return cls(math.isqrt(len(cells)), occupancy, stack.stack)
+
+    # Copy of the position (the copy starts with an empty undo history)
+    def clone(self):
+        new_state = GameState.__new__(GameState)
+        new_state.size = self.size
+        new_state.topology = self.topology
+        new_state.occupancy = self.occupancy[:]
+        new_state.stack = self.stack[:]
+        new_state.last_player = self.last_player
+        new_state.last_type = self.last_type
+        new_state.last_cell = self.last_cell
+        new_state.history = []
+        new_state.hash = self.hash
+        new_state.owners = self.owners[:]
+        new_state.runs = [runs[:] for runs in self.runs]
+        new_state.lines = self.lines[:]
+        new_state.line_tally = [tally[:] for tally in self.line_tally]
+        return new_state
+
+    # Pickled without the topology (shared by every state of a SIZE), so states are cheap
+    # to send to worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["topology"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.topology = get_topology(self.size)
+
+    # Full Zobrist hash over (cell, owner) and the stack counters
+    def compute_hash(self):
+        topology = self.topology
+        value = 0
+        for player in (0, 1):
+            for cell_id in iter_bits(self.occupancy[player]):
+                value ^= topology.zobrist_cells[player][cell_id]
+            value ^= topology.zobrist_stack[player][self.stack[player]]
+        return value
+
+    def occupied(self):
+        return self.occupancy[0] | self.occupancy[1]
+
+    def owner(self, cell_id):
+        if self.occupancy[0] >> cell_id & 1:
+            return 0
+        if self.occupancy[1] >> cell_id & 1:
+            return 1
+        return None
+
+    # Mask of the cells reachable by a piece of player standing on cell_id. Cell ids grow or shrink
+    # monotonically along a direction, so the first occupied cell of a ray is its lowest or highest
+    # blocker bit and the reachable part is every ray bit before it
+    def destination_mask(self, cell_id, player):
+        occupied = self.occupancy[0] | self.occupancy[1]
+        moves = 0
+        for ray, ascending in self.topology.rays[player][cell_id]:
+            blockers = ray & occupied
+            if not blockers:
+                moves |= ray
+            elif ascending:
+                moves |= ray & ((blockers & -blockers) - 1)
+            else:
+                length = blockers.bit_length()
+                moves |= ray >> length << length
+        return moves
+
+    # Cells reachable by a piece of player standing on cell_id
+    def destinations(self, cell_id, player):
+        return list(iter_bits(self.destination_mask(cell_id, player)))
+
+    # Mask of the enemy pieces flipped by a piece of player landing on cell_id
+    def flips(self, cell_id, player):
+        return self.flips_between(cell_id, self.occupancy[player], self.occupancy[1 - player])
+
+    # Same as flips() for arbitrary own/enemy masks
+    def flips_between(self, cell_id, own, enemy):
+        flipped = 0
+        for neighbors in self.topology.neighbors:
+            line = 0
+            next_cell = neighbors[cell_id]
+            while next_cell >= 0 and enemy >> next_cell & 1:
+                line |= 1 << next_cell
+                next_cell = neighbors[next_cell]
+            if line and next_cell >= 0 and own >> next_cell & 1:
+                flipped |= line
+        return flipped
+
+    # Number of pieces of player in a row through cell_id along one axis
+    def count_in_line(self, cell_id, player, axis):
+        return self.count_in_mask(cell_id, self.occupancy[player], axis)
+
+    # Same as count_in_line() for an arbitrary mask of own pieces
+    def count_in_mask(self, cell_id, own, axis):
+        count = 1
+        for direction in axis:
+            neighbors = self.topology.neighbors[direction]
+            next_cell = neighbors[cell_id]
+            while next_cell >= 0 and own >> next_cell & 1:
+                count += 1
+                next_cell = neighbors[next_cell]
+        return count
+
+    def longest_line(self, cell_id, player):
+        return max(self.count_in_line(cell_id, player, axis) for axis in AXES)
+
+    # Longest line through the landing cell and mask of flipped pieces of a move, without playing it
+    def move_effect(self, move, player):
+        own = self.occupancy[player]
+        if move[0] == "placement":
+            cell_id = move[1]
+            own |= 1 << cell_id
+            flipped = 0
+        else:
+            cell_id = move[2]
+            own ^= (1 << move[1]) | (1 << cell_id)
+            flipped = self.flips_between(cell_id, own, self.occupancy[1 - player])
+            own |= flipped
+        return max(self.count_in_mask(cell_id, own, axis) for axis in AXES), flipped
+
+    # ------------------ LINE TALLIES ------------------
+    # For the evaluation every piece counts under the length of the longest line through it.
+    # runs[axis][cell] is the length of the same-owner run along the axis containing the cell,
+    # lines[cell] the longest of the three and line_tally[player][length] how many pieces of the
+    # player have that longest line. A move only changes the runs through the cells it changes,
+    # so they are recounted from there instead of over the whole board
+    def reset_lines(self):
+        cells = self.topology.cells
+        self.owners = [-1] * cells
+        self.runs = [[0] * cells for _ in AXES]
+        self.lines = [0] * cells
+        self.line_tally = [[0] * (self.size + 1) for _ in (0, 1)]
+        self.update_lines(list(iter_bits(self.occupied())))
+
+    # Recount the lines after the owner of the given cells changed in the occupancy masks
+    def update_lines(self, changed):
+        owners = self.owners
+        lines = self.lines
+        runs = self.runs
+        tally = self.line_tally
+        neighbors = self.topology.neighbors
+        occupancy = self.occupancy
+
+        for cell_id in changed:
+            if owners[cell_id] >= 0:
+                tally[owners[cell_id]][lines[cell_id]] -= 1
+                lines[cell_id] = 0
+            owners[cell_id] = 0 if occupancy[0] >> cell_id & 1 else 1 if occupancy[1] >> cell_id & 1 else -1
+
+        touched = set()
+        for axis_index, (backward, forward) in enumerate(AXES):
+            axis_runs = runs[axis_index]
+            for cell_id in changed:
+                if owners[cell_id] >= 0:
+                    starts = (cell_id,)
+                else:
+                    axis_runs[cell_id] = 0
+                    touched.add(cell_id)
+                    starts = (neighbors[backward][cell_id], neighbors[forward][cell_id])
+                for start in starts:
+                    if start < 0 or owners[start] < 0:
+                        continue
+                    # Go back to the first cell of the occupied stretch, then recount it run by run
+                    while neighbors[backward][start] >= 0 and owners[neighbors[backward][start]] >= 0:
+                        start = neighbors[backward][start]
+                    stretch = []
+                    current = start
+                    while current >= 0 and owners[current] >= 0:
+                        stretch.append(current)
+                        current = neighbors[forward][current]
+                    run_start = 0
+                    for i in range(1, len(stretch) + 1):
+                        if i == len(stretch) or owners[stretch[i]] != owners[stretch[run_start]]:
+                            for j in range(run_start, i):
+                                axis_runs[stretch[j]] = i - run_start
+                            run_start = i
+                    touched.update(stretch)
+
+        first, second, third = runs
+        for cell_id in touched:
+            owner = owners[cell_id]
+            if owner < 0:
+                continue
+            if lines[cell_id]:
+                tally[owner][lines[cell_id]] -= 1
+            longest = max(first[cell_id], second[cell_id], third[cell_id])
+            lines[cell_id] = longest
+            tally[owner][longest] += 1
+
+    # ------------------ MAKE / UNMAKE MOVE ------------------
+    # Apply a legal move in place and record what is needed to take it back:
+    # the move, its player, the exact pieces flipped, the previous hash and last action
+    def make_move(self, move, player):
+        topology = self.topology
+        own_keys = topology.zobrist_cells[player]
+        previous_hash = self.hash
+
+        if move[0] == "placement":
+            cell_id = move[1]
+            flipped = 0
+            stack_keys = topology.zobrist_stack[player]
+            self.hash ^= own_keys[cell_id] ^ stack_keys[self.stack[player]] ^ stack_keys[self.stack[player] - 1]
+            self.stack[player] -= 1
+            self.occupancy[player] |= 1 << cell_id
+        else:
+            cell_id = move[2]
+            self.hash ^= own_keys[move[1]] ^ own_keys[cell_id]
+            self.occupancy[player] ^= (1 << move[1]) | (1 << cell_id)
+            flipped = self.flips(cell_id, player)
+            if flipped:
+                enemy_keys = topology.zobrist_cells[1 - player]
+                for flipped_id in iter_bits(flipped):
+                    self.hash ^= own_keys[flipped_id] ^ enemy_keys[flipped_id]
+                self.occupancy[player] |= flipped
+                self.occupancy[1 - player] ^= flipped
+
+        self.update_lines(self.changed_cells(move, flipped))
+        self.history.append((move, player, flipped, previous_hash, self.last_player, self.last_type, self.last_cell))
+        self.last_player, self.last_type, self.last_cell = player, move[0], cell_id
+
+    # Restore the position exactly as it was before the last make_move
+    def unmake_move(self):
+        move, player, flipped, self.hash, self.last_player, self.last_type, self.last_cell = self.history.pop()
+        if move[0] == "placement":
+            self.stack[player] += 1
+            self.occupancy[player] ^= 1 << move[1]
+        else:
+            self.occupancy[1 - player] |= flipped
+            self.occupancy[player] ^= flipped | (1 << move[1]) | (1 << move[2])
+        self.update_lines(self.changed_cells(move, flipped))
+
+    @staticmethod
+    def changed_cells(move, flipped):
+        if move[0] == "placement":
+            return [move[1]]
+        changed = [move[1], move[2]]
+        if flipped:
+            changed.extend(iter_bits(flipped))
+        return changed
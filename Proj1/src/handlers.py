@@ -1,13 +1,13 @@
 from pieces import *
 from board import *
+from gamestate import GameState
+import rules
 import math
 from enum import Enum
 
 # This variable will be used to hold the selected piece when moving
 PENDING_PIECE = None
 VALID_MOVES = None
-FIRST_MOVE = None
-WINNER = None
 
 # Enum with possible states
 class States(Enum):
@@ -17,102 +17,32 @@ class States(Enum):
 
 STATE = States.DEFAULT
 
-# Setup variables before starting a game
-def setup_game():
-    global FIRST_MOVE
-    FIRST_MOVE = True
-    
-# Check how many cells are in a row
-def check_row(dir1, dir2, cell: Cell):
-    cells_in_a_row = 1
-    next_cell : Cell = cell.neighbors[dir1]
-    while next_cell != None and next_cell.has_piece() and next_cell.piece.player == cell.piece.player:
-        next_cell = next_cell.neighbors[dir1]
-        cells_in_a_row += 1
-    next_cell = cell.neighbors[dir2]
-    while next_cell != None and next_cell.has_piece() and next_cell.piece.player == cell.piece.player:
-        next_cell = next_cell.neighbors[dir2]
-        cells_in_a_row += 1
-    
-    return cells_in_a_row
-
-
-# Check if a win / loss condition has been met
-# 0 : nothing
-# 1 : win
-# 2 : loss
-def check_conditions(cell: Cell):
-    global WINNER
-    if cell is None or cell.piece is None:
-        return False
-    cells_in_a_row = 1
-    
-    cells_in_a_row = max(cells_in_a_row, check_row("UP", "DOWN", cell))
-    cells_in_a_row = max(cells_in_a_row, check_row("UP_RIGHT", "DOWN_LEFT", cell))
-    cells_in_a_row = max(cells_in_a_row, check_row("UP_LEFT", "DOWN_RIGHT", cell))
-        
-    if cells_in_a_row > 4:
-        WINNER = abs(cell.piece.player - 1)
-        return True
-    elif cells_in_a_row == 4:
-        WINNER = cell.piece.player
-        return True
-    else:
-        return False
-        
-
-# Check if a flip occurs after a move
-def check_flip(cell: Cell):
-    possible_flips = []
-    current_cell = cell
-    for direction in DIRECTIONS:
-        next_cell : Cell = current_cell.neighbors[direction]
-        while next_cell != None and next_cell.has_piece() and next_cell.piece.player != cell.piece.player:
-            current_cell = next_cell
-            next_cell : Cell = current_cell.neighbors[direction]
-            possible_flips.append(current_cell.piece)
-        if next_cell != None and next_cell.has_piece() and current_cell.neighbors[direction].piece.player == cell.piece.player:
-            for piece in possible_flips:
-                piece.flip()
-        possible_flips.clear()
-        current_cell = cell
-        
+# Position on the board, for the rules kernel
+def board_state():
+    return GameState.from_board(graph, stack)
 
-# Recursive function, adds valid cells in a single direction until a move in impossible
-# (color_switched) if the sequence of cells has already changed color
-def validate_direction(direction, current_cell: Cell, piece: Piece, color_switched):
-    possible_moves = []
-    next_cell: Cell = current_cell.neighbors[direction]
 
-    if next_cell == None:
-        return possible_moves
-    
-    if next_cell.piece != None:
-        return possible_moves
-        
-    # See if the color of the cell is equal to the color of the player
-    cell_player_color = (piece.player == 0 and next_cell.type == BLUE) or (piece.player == 1 and next_cell.type == WHITE)
+# Play a legal move on the board. The rules kernel plays it on the position and judges it, then the
+# pieces are updated to mirror the resulting position (flips included).
+# Returns the winner, None while the game goes on
+def play_move(move, turn):
+    state = board_state()
+    state.make_move(move, turn)
+    if move[0] == "placement":
+        stack.place_piece(graph[move[1]], turn)
+    else:
+        graph[move[1]].piece.move_to(graph[move[2]])
+    for cell in graph:
+        if cell.piece is not None and cell.piece.player != state.owner(cell.id):
+            cell.piece.flip()
+    return rules.winner(state)
 
-        
-    if current_cell.type == next_cell.type:
-        possible_moves.append(next_cell)
-        if cell_player_color:
-            possible_moves.extend(validate_direction(direction, next_cell, piece, color_switched))   
-    elif color_switched == False:
-        possible_moves.append(next_cell)
-        if cell_player_color:    
-            possible_moves.extend(validate_direction(direction, next_cell, piece, True))
-            
-            
-    return possible_moves
 
 # Fill a list of possible moves and highlight the possible cells
 def valid_moves(piece: Piece):
     global VALID_MOVES
-    VALID_MOVES = []
-    current_cell = piece.cell
-    for direction in DIRECTIONS:
-        VALID_MOVES.extend(validate_direction(direction, current_cell, piece, False))
+    destinations = rules.piece_destinations(board_state(), piece.cell.id, piece.player)
+    VALID_MOVES = [graph[cell_id] for cell_id in destinations]
         
     for cell in VALID_MOVES:
         cell.highlighted = True
@@ -132,15 +62,16 @@ def setup_place():
     stack.highlighted = True
     STATE = States.PENDING_PLACE
 
-# Move the piece and reset values
-def make_move(cell: Cell):
+# Move the piece and reset values, returns the winner or None
+def make_move(cell: Cell, turn):
     global PENDING_PIECE, STATE, VALID_MOVES
-    PENDING_PIECE.move_to(cell)
     PENDING_PIECE.highlighted = False
+    result = play_move(("move", PENDING_PIECE.cell.id, cell.id), turn)
     PENDING_PIECE = None
     for cell in VALID_MOVES:
         cell.highlighted = False
     STATE = States.DEFAULT
+    return result
 
 
 # Get the selected object
@@ -155,17 +86,12 @@ def get_selected(x, y):
     if math.sqrt((x - 550) ** 2 + (y - 600) ** 2) < HEX_RADIUS * 2 // 3:
         return 1
     
-    for cell in graph:
-        cx, cy = cell.pos
-        distance = math.sqrt((x - cx) ** 2 + (y - cy) ** 2)
-        if distance < HEX_RADIUS:
-            return cell
-        
-    return None
+    cell_id = cell_at(x, y)
+    return graph[cell_id] if cell_id is not None else None
 
 # Handle what happens when a click occurs
 def handle_click(x, y, turn):
-    global PENDING_PIECE, STATE, VALID_MOVES, FIRST_MOVE, WINNER
+    global PENDING_PIECE, STATE, VALID_MOVES
 
     selected = get_selected(x, y)
 
@@ -202,22 +128,21 @@ def handle_click(x, y, turn):
         elif piece is None and STATE == States.PENDING_MOVE:
             if selected in VALID_MOVES:
                 from_id = PENDING_PIECE.cell.id
-                make_move(selected)
-                check_flip(selected)
-                move_cell = selected
-                if check_conditions(selected):
-                    return (WINNER + 2, move_cell, "move", from_id)
+                result = make_move(selected, turn)
+                if result is not None:
+                    return (result + 2, selected, "move", from_id)
                 else:
-                    return (1 - turn, move_cell, "move", from_id)
+                    return (1 - turn, selected, "move", from_id)
             else:
                 print("invalid move")
         elif piece is None and STATE == States.PENDING_PLACE:
-            is_corner = selected.id == 0 or selected.id == SIZE - 1 or selected.id == SIZE * SIZE - SIZE or selected.id == SIZE * SIZE - 1
-            if not (FIRST_MOVE and is_corner):
-                FIRST_MOVE = False
-                stack.place_piece(selected, turn)
+            move = ("placement", selected.id)
+            if rules.is_legal(board_state(), move, turn):
+                result = play_move(move, turn)
                 stack.highlighted = False
                 STATE = States.DEFAULT
+                if result is not None:
+                    return (result + 2, selected, "placement", None)
                 return (1 - turn, selected, "placement", None)
 
     return turn
@@ -1,43 +1,54 @@
 import time
 import os
 from datetime import datetime
+from gamestate import GameState
 
 class GameLogger:
-    def __init__(self, game_mode, bot_configs, board_size):
+    def __init__(self, game_mode, bot_configs, board_size, search_stats=True):
         self.start_time = time.time()
+        self.search_stats = search_stats # Collect and log the search counters of bot moves
         self.moves = []
         self.game_mode = game_mode
         self.bot_configs = bot_configs
         self.board_size = str(board_size)
         self.winner = None
 
-    def log_move(self, time, player, move_type, cell_id, from_id=None):
+    # stats: search counters of a bot move (e.g. SearchStats.log_fields()), written after the time
+    def log_move(self, time, player, move_type, cell_id, from_id=None, stats=None):
         time = round(time, 2)
 
         if move_type == "placement":
-            self.moves.append(f"Player {player + 1} placed at cell {cell_id}, took {time} seconds")
+            line = f"Player {player + 1} placed at cell {cell_id}, took {time} seconds"
         elif move_type == "move":
-            self.moves.append(f"Player {player + 1} moved from cell {from_id} to {cell_id}, took {time} seconds")
+            line = f"Player {player + 1} moved from cell {from_id} to {cell_id}, took {time} seconds"
+        if stats:
+            line += " [" + " ".join(f"{name}={value}" for name, value in stats.items()) + "]"
+        self.moves.append(line)
 
     def set_winner(self, winner):
         self.winner = winner
 
-    def save_to_file(self):
-        from board import SIZE, graph
-        from pieces import stack
+    # The final position is read from the GUI board unless a GameState is given (headless games)
+    def save_to_file(self, state=None, folder="game_logs", name=None):
+        if state is None:
+            from board import graph
+            from pieces import stack
+            state = GameState.from_board(graph, stack)
 
         total_time = round(time.time() - self.start_time, 2)
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        folder = "game_logs"
         os.makedirs(folder, exist_ok=True)
-        filename = os.path.join(folder, f"game_log_{timestamp}.txt")
+        filename = os.path.join(folder, f"game_log_{name or timestamp}.txt")
 
         with open(filename, "w") as file:
             file.write(f"Game Mode: {self.game_mode}\n")
             if self.bot_configs:
                 file.write(f"Bot Configs: {self.bot_configs}\n")
             file.write(f"Board Size: {self.board_size}\n")
-            file.write(f"Winner: Player {self.winner + 1}\n")
+            if self.winner is None:
+                file.write("Winner: Draw\n")
+            else:
+                file.write(f"Winner: Player {self.winner + 1}\n")
             file.write(f"Total Time: {total_time} seconds\n")
             file.write("Moves:\n")
             for i, move in enumerate(self.moves):
@@ -45,17 +56,17 @@ class GameLogger:
 
             # Add an empty line before board state
             file.write("\n")
-            file.write(f"stack1: {stack.stack[0]}\n")
-            file.write(f"stack2: {stack.stack[1]}\n")
+            file.write(f"stack1: {state.stack[0]}\n")
+            file.write(f"stack2: {state.stack[1]}\n")
             file.write("\n")
 
             # Write final board state as grid
-            for row in range(SIZE):
+            for row in range(state.size):
                 line = ""
-                for col in range(SIZE):
-                    cell = graph[row * SIZE + col]
-                    if cell.piece is None:
+                for col in range(state.size):
+                    owner = state.owner(row * state.size + col)
+                    if owner is None:
                         line += "-"
                     else:
-                        line += str(cell.piece.player + 1)
+                        line += str(owner + 1)
                 file.write(line + "\n")
@@ -1,16 +1,60 @@
 import pygame
+import sys
 import time
 from board import *
 from pieces import *
 from handlers import *
 from menu import *
-import algorithm as alg
+import engine
 from logger import GameLogger
 
 
 # Initialize Pygame
 pygame.init()
 
+# Bot settings per difficulty
+MCTS_ITERATIONS = {"Easy": 25, "Medium": 50, "Hard": 100}
+MINIMAX_TIME_BUDGET = {"Easy": 100, "Medium": 500, "Hard": 2000} # Time per move in milliseconds
+MINIMAX_DEPTH = {"Easy": 1, "Medium": 2, "Hard": None}           # Maximum depth (None = as deep as time allows)
+# Search counters of bot moves in the game logs. Off (python main.py --no-search-stats) the searches
+# count nothing, and the progress shown while a bot thinks is its time only
+SEARCH_STATS = "--no-search-stats" not in sys.argv
+
+FPS = 60
+BOT_MOVE_DELAY = 1.0 # Seconds each bot move stays on screen in computer vs computer games
+
+# Bot searches and hints run on this worker, so the window keeps drawing and handling events
+search_worker = engine.SearchWorker()
+
+
+# Everything drawn over the board layer in a frame, in drawing order
+def frame_items(turn, message=None, hovered=None):
+    items = cell_items(hovered) + stack.items(screen, turn)
+    items.append(text_item(f"Player {turn + 1}'s Turn", 36, (WIDTH // 2, 20)))
+    if message:
+        items.append(text_item(message, 28, (WIDTH // 2, HEIGHT - 50)))
+    return items
+
+
+# A player without a legal move ends the game in a draw, as in tournament games.
+# Returns the choice made on the final screen
+def end_in_draw(logger, renderer, turn):
+    logger.set_winner(None)
+    logger.save_to_file()
+    renderer.render(frame_items(turn))
+    return show_final_state(None, None, turn, stack)
+
+
+# Text shown while a bot searches
+def search_progress(job, turn):
+    stats = job.stats
+    if isinstance(stats, engine.MCTSStats):
+        return f"Player {turn + 1} is thinking... {stats.iterations} iterations"
+    if stats is not None:
+        return f"Player {turn + 1} is thinking... depth {stats.max_depth}, {stats.nodes} nodes"
+    return f"Player {turn + 1} is thinking... {job.elapsed():.1f} s"
+
+
 def game_loop():
     start_game = main_menu()
     
@@ -28,38 +72,54 @@ def game_loop():
         bot_configs = []
 
     game_mode = start_game[0]
-    logger = GameLogger(game_mode, bot_configs, get_size())
+    logger = GameLogger(game_mode, bot_configs, get_size(), search_stats=SEARCH_STATS)
+
+    # Monte Carlo bots keep their search tree between turns
+    mcts_sessions = {}
+    for index, (algorithm_name, difficulty) in enumerate(bot_configs):
+        if algorithm_name == "MonteCarlo":
+            bot_turn = index if game_mode == "computer_vs_computer" else 1
+            mcts_sessions[bot_turn] = engine.MCTSSession(bot_turn)
+
+    # Against a human, the bot ponders while the human thinks
+    ponderer = None
+    if game_mode == "human_vs_computer":
+        algorithm_name, difficulty = bot_configs[0]
+        ponderer = engine.Ponderer(1, mcts_sessions.get(1), MINIMAX_DEPTH["Easy Medium Hard".split()[difficulty - 1]])
     
     running = True
     turn = 0
     winner = None
-    setup_game()
     graph = create_graph()
     reset_handlers(graph)
     stack.__init__()
     human_start_time = None
+    search_job = None    # Bot move being searched on the worker thread
+    hint_job = None      # Hint being searched on the worker thread
+    next_bot_move = 0.0  # Earliest time the next bot move is shown, so computer games can be followed
+    clock = pygame.time.Clock()
+    renderer = FrameRenderer() # Only redraws what changed between frames
 
     while running:
-        screen.fill(BG_COLOR)
-        draw_graph()
-        stack.draw_stack_and_pieces(screen, turn)
-        
-        # Show current turn
-        font = pygame.font.Font(None, 36)
-        turn_text = f"Player {turn + 1}'s Turn"
-        turn_surface = font.render(turn_text, True, (0, 0, 0))
-        screen.blit(turn_surface, (WIDTH // 2 - turn_surface.get_width() // 2, 20))
-        
+        message = None # Line of text under the board
+        hovered = None # Cell under the mouse on a human's turn
         
         # Human Player
         if game_mode == "human_vs_human" or (game_mode == "human_vs_computer" and turn == 0):
             if human_start_time is None:
+                if not engine.legal_moves(board_state(), turn):
+                    if end_in_draw(logger, renderer, turn) == "restart":
+                        return True
+                    break
                 human_start_time = time.time()
+                if ponderer is not None:
+                    ponderer.start(engine.GameState.from_board(graph, stack))
             if winner is None:
-                hint_message = "Press 'M' for a hint using Minimax or 'C' for a hint using Monte Carlo"
-                hint_font = pygame.font.Font(None, 28)
-                hint_surface = hint_font.render(hint_message, True, (0, 0, 0))
-                screen.blit(hint_surface, (WIDTH // 2 - hint_surface.get_width() // 2, HEIGHT - 50))
+                hovered = cell_at(*pygame.mouse.get_pos())
+                if hint_job is None:
+                    message = "Press 'M' for a hint using Minimax or 'C' for a hint using Monte Carlo"
+                else:
+                    message = f"Looking for a hint... {hint_job.elapsed():.1f} s"
 
                 
             for event in pygame.event.get():
@@ -67,30 +127,19 @@ def game_loop():
                     running = False
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                     running = False
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_m:
-                    current_state = alg.GameState(graph, stack.pieces, stack)
-                    depth = 3
-                    hint_move = alg.best_move(current_state, turn, depth)
-                    if hint_move[0] == "placement":
-                        hint_cell = next(c for c in graph if c.id == hint_move[1].id)
-                        hint_cell.hint = True
-                    elif hint_move[0] == "move":
-                        origin_cell = next(c for c in graph if c.id == hint_move[1].id)
-                        destination_cell = next(c for c in graph if c.id == hint_move[2].id)
-                        origin_cell.hint = True
-                        destination_cell.hint = True
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
-                    current_state = alg.GameState(graph, stack.pieces, stack)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_m and hint_job is None:
+                    current_state = engine.GameState.from_board(graph, stack)
+                    time_budget = 1000 # Milliseconds
+                    # The hint has the CPU (and the transposition table) to itself
+                    if ponderer is not None:
+                        ponderer.stop()
+                    hint_job = search_worker.submit(engine.best_move, current_state, turn, time_budget=time_budget)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_c and hint_job is None:
+                    current_state = engine.GameState.from_board(graph, stack)
                     iterations = 50
-                    hint_move = alg.best_move_mcts(current_state, turn, iterations) 
-                    if hint_move[0] == "placement":
-                        hint_cell = next(c for c in graph if c.id == hint_move[1].id)
-                        hint_cell.hint = True
-                    elif hint_move[0] == "move":
-                        origin_cell = next(c for c in graph if c.id == hint_move[1].id)
-                        destination_cell = next(c for c in graph if c.id == hint_move[2].id)
-                        origin_cell.hint = True
-                        destination_cell.hint = True
+                    if ponderer is not None:
+                        ponderer.stop()
+                    hint_job = search_worker.submit(engine.best_move_mcts, current_state, turn, iterations)
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     clear_hints()
                     x, y = pygame.mouse.get_pos()
@@ -100,6 +149,14 @@ def game_loop():
                         new_turn, move_cell, move_type, from_id = result
                         move_time = time.time() - human_start_time
                         logger.log_move(move_time, turn, move_type, move_cell.id, from_id)
+                        played = ("placement", move_cell.id) if move_type == "placement" else ("move", from_id, move_cell.id)
+                        if hint_job is not None:
+                            hint_job.cancel()
+                            hint_job = None
+                        if ponderer is not None:
+                            ponderer.stop()
+                        for session in mcts_sessions.values():
+                            session.record(played)
                         turn = new_turn
                         human_start_time = None
                         
@@ -115,49 +172,79 @@ def game_loop():
                     else:
                         turn = result
 
+            # Show the hint once it is found, then go back to pondering
+            if running and hint_job is not None and hint_job.done():
+                hint_move = hint_job.result()
+                hint_job = None
+                if hint_move is not None:
+                    graph[hint_move[1]].hint = True
+                    if hint_move[0] == "move":
+                        graph[hint_move[2]].hint = True
+                if ponderer is not None:
+                    ponderer.start(engine.GameState.from_board(graph, stack))
+
         # AI logic
         else:
             algorithm_name, difficulty = bot_configs[turn if game_mode == "computer_vs_computer" else 0]
-            pygame.display.flip()
-
-            current_state = alg.GameState(graph, stack.pieces, stack)
-            
-            if algorithm_name == "MonteCarlo":
-                iterations_map = {"Easy": 25, "Medium": 50, "Hard": 100}
-                difficulty_str = "Easy Medium Hard".split()[difficulty - 1]
-                iterations = iterations_map[difficulty_str]
-                start_time = time.time()
-                move = alg.best_move_mcts(current_state, turn, iterations)
-                move_time = time.time() - start_time
-
-            else:
-                depth_map = {"Easy": 1, "Medium": 2, "Hard": 3}
-                difficulty_str = "Easy Medium Hard".split()[difficulty - 1]
-                depth = depth_map[difficulty_str]
-                start_time = time.time()
-                move = alg.best_move(current_state, turn, depth)
-                move_time = time.time() - start_time
-
-            if move[0] == "placement":
-                selected_cell = next(c for c in graph if c.id == move[1].id)
-                stack.place_piece(selected_cell, turn)
-                move_cell = selected_cell
-                logger.log_move(move_time, turn, "placement", selected_cell.id)
-                
-            elif move[0] == "move":
-                origin = next(c for c in graph if c.id == move[1].id)
-                destination = next(c for c in graph if c.id == move[2].id)
-                if origin.piece:
-                    origin.piece.move_to(destination)
-                    check_flip(destination)
-                    move_cell = destination
-                    logger.log_move(move_time, turn, "move", destination.id, origin.id)
-
-                if check_conditions(move_cell):
-                    winner = turn
+            difficulty_str = "Easy Medium Hard".split()[difficulty - 1]
+            move = None
+
+            # Start the search; the board does not change until its move is played
+            if search_job is None:
+                current_state = engine.GameState.from_board(graph, stack)
+                if algorithm_name == "MonteCarlo":
+                    iterations = MCTS_ITERATIONS[difficulty_str]
+                    stats = engine.MCTSStats() if logger.search_stats else None
+                    search_job = search_worker.submit(mcts_sessions[turn].best_move, current_state, iterations,
+                                                      stats=stats)
+                else:
+                    time_budget = MINIMAX_TIME_BUDGET[difficulty_str]
+                    max_depth = MINIMAX_DEPTH[difficulty_str]
+                    # A search finished while pondering is played without searching again
+                    move = ponderer.lookup(current_state) if ponderer is not None else None
+                    move_time, stats = 0.0, None
+                    if move is None:
+                        stats = engine.SearchStats() if logger.search_stats else None
+                        search_job = search_worker.submit(engine.best_move, current_state, turn, max_depth,
+                                                          time_budget=time_budget, stats=stats)
+
+            if search_job is not None:
+                message = search_progress(search_job, turn)
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    running = False
+
+            if running and search_job is not None and search_job.done() and time.perf_counter() >= next_bot_move:
+                move = search_job.result()
+                move_time = search_job.elapsed()
+                stats = search_job.stats
+                search_job = None
+                # The search only finds no move when the bot has none: searching again would never end
+                if move is None:
+                    if end_in_draw(logger, renderer, turn) == "restart":
+                        return True
+                    break
+
+            if running and move is not None:
+                for session in mcts_sessions.values():
+                    session.record(move)
+
+                # The rules kernel plays the move and judges it, as for a human move
+                log_stats = stats.log_fields() if stats is not None and logger.search_stats else None
+                result = play_move(move, turn)
+                if move[0] == "placement":
+                    move_cell = graph[move[1]]
+                    logger.log_move(move_time, turn, "placement", move_cell.id, stats=log_stats)
+                elif move[0] == "move":
+                    move_cell = graph[move[2]]
+                    logger.log_move(move_time, turn, "move", move_cell.id, move[1], log_stats)
+
+                if result is not None:
+                    winner = result
                     logger.set_winner(winner)
                     logger.save_to_file()
-                    pygame.display.flip()
+                    renderer.render(frame_items(turn))
                     pygame.time.wait(2000)
                     choice = show_final_state(winner, move_cell, turn, stack)
                     if choice == "restart":
@@ -165,15 +252,23 @@ def game_loop():
                     running = False
                     break
 
-            pygame.time.wait(1000)
-            turn = 1 - turn
+                if game_mode == "computer_vs_computer":
+                    next_bot_move = time.perf_counter() + BOT_MOVE_DELAY
+                turn = 1 - turn
 
         if turn >= 2:
             winner = turn - 1
             break
 
-        pygame.display.flip()
+        renderer.render(frame_items(turn, message, hovered))
+        clock.tick(FPS)
 
+    # Leaving the game (ESC or closing the window) stops the searches still running
+    for job in (search_job, hint_job):
+        if job is not None:
+            job.cancel()
+    if ponderer is not None:
+        ponderer.stop()
     return False
 
 
@@ -182,4 +277,5 @@ while True:
     if not game_loop():
         break
 
+search_worker.shutdown()
 pygame.quit()
\ No newline at end of file
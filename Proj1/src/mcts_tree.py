@@ -0,0 +1,78 @@
+from array import array
+
+NO_NODE = -1
+UNKNOWN = 0xFFFF # Legal move count of a node that was never expanded
+
+
+# Struct-of-arrays MCTS tree: node i is entry i of every array. Nodes hold no game state,
+# the search replays their move codes from the root position instead
+class MCTSTree:
+    def __init__(self):
+        self.parent = array("i")        # Index of the parent node
+        self.move = array("i")          # Code of the move that led to the node (-1 for the root)
+        self.visits = array("i")
+        self.wins = array("i")          # Wins of the player who made the move
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.children = array("H")      # Number of children
+        self.moves = array("H")         # Number of legal moves in the node's position
+        self.add_node(NO_NODE, NO_NODE)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def arrays(self):
+        return (self.parent, self.move, self.visits, self.wins, self.first_child, self.next_sibling, self.children, self.moves)
+
+    def add_node(self, parent, move):
+        index = len(self.parent)
+        self.parent.append(parent)
+        self.move.append(move)
+        self.visits.append(0)
+        self.wins.append(0)
+        self.first_child.append(NO_NODE)
+        self.moves.append(UNKNOWN)
+        self.children.append(0)
+        if parent == NO_NODE:
+            self.next_sibling.append(NO_NODE)
+        else:
+            self.next_sibling.append(self.first_child[parent])
+            self.first_child[parent] = index
+            self.children[parent] += 1
+        return index
+
+    def child_nodes(self, node):
+        child = self.first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def find_child(self, node, move):
+        for child in self.child_nodes(node):
+            if self.move[child] == move:
+                return child
+        return NO_NODE
+
+    def bytes_per_node(self):
+        return sum(values.itemsize for values in self.arrays())
+
+    def memory(self):
+        return len(self) * self.bytes_per_node()
+
+    # New tree holding a copy of the subtree below node, which becomes the root
+    def subtree(self, node):
+        tree = MCTSTree()
+        tree.visits[0] = self.visits[node]
+        tree.wins[0] = self.wins[node]
+        tree.moves[0] = self.moves[node]
+        stack = [(node, 0)]
+        while stack:
+            old, new = stack.pop()
+            # Children are linked newest first; copy them oldest first to keep the same order
+            for child in reversed(list(self.child_nodes(old))):
+                copy = tree.add_node(new, self.move[child])
+                tree.visits[copy] = self.visits[child]
+                tree.wins[copy] = self.wins[child]
+                tree.moves[copy] = self.moves[child]
+                stack.append((child, copy))
+        return tree
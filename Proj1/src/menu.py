@@ -341,7 +341,7 @@ def show_final_state(winner, last_move, turn, stack):
             x, y = last_move.pos
             pygame.draw.circle(screen, (255, 255, 0), (x, y), HEX_RADIUS * 2 // 3 + 5, 3)
 
-        message = f"Player {winner + 1} won!"
+        message = "Draw!" if winner is None else f"Player {winner + 1} won!"
         text_surface = final_font.render(message, True, BLACK)
         text_rect = text_surface.get_rect(center=(WIDTH // 2, HEIGHT - 150))
         screen.blit(text_surface, text_rect)
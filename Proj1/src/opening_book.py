@@ -0,0 +1,130 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from gamestate import GameState, encode_move, decode_move
+from transposition import TranspositionTable
+
+# Opening book: for the positions of the first plies, the move a deep search chose offline.
+# One file per SIZE, a header followed by entries sorted by key, memory-mapped and binary searched
+# so loading a book costs nothing and only the pages that are probed are read. The key is the
+# Zobrist hash of the position with the side to move, like in the transposition table
+
+BOOK_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "books")
+MAGIC = b"YHOB"
+HEADER = struct.Struct("<4sHHI")  # Magic, format version, SIZE, number of entries
+ENTRY = struct.Struct("<QHH")     # Position key, move code, depth of the search that chose it
+VERSION = 1
+
+
+def book_path(size):
+    return os.path.join(BOOK_FOLDER, f"opening_{size}.bin")
+
+
+def book_key(state: GameState, player: int):
+    return state.hash ^ state.topology.zobrist_turn[player]
+
+
+# ------------------ READING ------------------
+class OpeningBook:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book of this version")
+
+    def entry(self, index):
+        return ENTRY.unpack_from(self.data, HEADER.size + index * ENTRY.size)
+
+    # Book move for player in state, None when the position is not in the book
+    def probe(self, state: GameState, player: int):
+        key = book_key(state, player)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count:
+            return None
+        entry_key, code, depth = self.entry(low)
+        if entry_key != key:
+            return None
+        return decode_move(code, state.topology.cells)
+
+
+_books = {}
+
+# Book of a SIZE, None if no book file was generated for it
+def get_book(size):
+    if size not in _books:
+        path = book_path(size)
+        _books[size] = OpeningBook(path) if os.path.exists(path) else None
+    return _books[size]
+
+
+def book_move(state: GameState, player: int):
+    book = get_book(state.size)
+    return book.probe(state, player) if book is not None else None
+
+
+# ------------------ GENERATION ------------------
+# Walks the first `plies` plies from the empty board. Where the player being booked is to move, a
+# fixed-depth search picks the book move and only that move is followed; every reply of the other
+# player is followed. Done for both players, so the book answers whichever side the bot plays
+def generate(size, plies=4, depth=4, log=print):
+    import algorithm as alg
+
+    entries = {}
+    start = time.perf_counter()
+    for book_player in (0, 1):
+        frontier = {book_key(GameState(size), 0): (GameState(size), 0)}
+        for ply in range(plies):
+            next_frontier = {}
+            for state, turn in frontier.values():
+                if turn == book_player:
+                    key = book_key(state, turn)
+                    if key not in entries:
+                        move = alg.best_move(state, turn, depth, table=TranspositionTable(), use_book=False)
+                        entries[key] = (encode_move(move, state.topology.cells), depth)
+                    moves = [decode_move(entries[key][0], state.topology.cells)]
+                else:
+                    moves = alg.list_possible_moves(state, turn)
+                for move in moves:
+                    child = state.clone()
+                    child.make_move(move, turn)
+                    if alg.terminal_score(child, turn) is None:
+                        next_frontier[book_key(child, 1 - turn)] = (child, 1 - turn)
+            frontier = next_frontier
+            log(f"player {book_player + 1}, ply {ply + 1}: {len(entries)} entries, {time.perf_counter() - start:.0f} s")
+    return entries
+
+
+def write_book(path, size, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, size, len(entries)))
+        for key in sorted(entries):
+            code, depth = entries[key]
+            file.write(ENTRY.pack(key, code, depth))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the Yonmoque-Hex opening book of a board SIZE")
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--plies", type=int, default=4, help="plies from the empty board covered by the book")
+    parser.add_argument("--depth", type=int, default=4, help="minimax depth of the search choosing each book move")
+    parser.add_argument("--output", help="book file (default: books/opening_{SIZE}.bin)")
+    args = parser.parse_args()
+
+    entries = generate(args.size, args.plies, args.depth)
+    path = args.output or book_path(args.size)
+    write_book(path, args.size, entries)
+    print(f"{len(entries)} positions written to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import math
+import os
+
+# Persistent process pool for the parallel searches. It is created on first use and kept
+# between moves, so starting the workers (and filling their transposition tables) is paid once.
+# multiprocessing is only imported then, which keeps importing the engine fast
+
+_pool = None
+_pool_workers = 0
+shared_alpha = None # Best root value found so far by any process in the current search
+
+
+def _init_worker(value):
+    global shared_alpha
+    shared_alpha = value
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def get_pool(workers=None):
+    global _pool, _pool_workers
+    workers = workers or default_workers()
+    if _pool is None or _pool_workers != workers:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        shutdown_pool()
+        value = multiprocessing.Value("d", -math.inf)
+        _init_worker(value)
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(value,))
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+        _pool_workers = 0
+
+
+# ------------------ SHARED ALPHA BOUND ------------------
+def reset_alpha(value=-math.inf):
+    with shared_alpha.get_lock():
+        shared_alpha.value = value
+
+
+def raise_alpha(value):
+    with shared_alpha.get_lock():
+        if value > shared_alpha.value:
+            shared_alpha.value = value
+
+
+def read_alpha():
+    return shared_alpha.value
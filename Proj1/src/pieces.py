@@ -1,5 +1,6 @@
 import pygame
 import math
+from functools import partial
 from board import *
 
 COLORS = [(255, 0, 0), (0, 255, 0)]
@@ -22,6 +23,14 @@ class Piece:
         self.cell = new_cell  # Update the piece's position
         return True
 
+    # Item (key, rect, draw) of the piece for the FrameRenderer
+    def item(self, screen):
+        x, y = self.cell.pos
+        radius = HEX_RADIUS * 2 // 3
+        rect = pygame.Rect(x - radius - 1, y - radius - 1, 2 * radius + 3, 2 * radius + 3)
+        key = ("piece", self.cell.id, self.player, self.cell.hint, self.highlighted)
+        return key, rect, partial(self.draw, screen)
+
     # Draw a piece (highlighted when selected to be moved)
     def draw(self, screen):
         if self.cell:
@@ -77,8 +86,7 @@ class Stack:
             pygame.draw.circle(screen, (0, 0, 0), (x, y), HEX_RADIUS * 2 // 3, 3)
         
         # Write the number of pieces left
-        font = pygame.font.Font(None, 24)
-        text_surface = font.render("x" + str(self.stack[player]), True, (0, 0, 0))
+        text_surface = render_text("x" + str(self.stack[player]), 24)
         text_rect = text_surface.get_rect(center=(x, y))
         
         screen.blit(text_surface, text_rect)
@@ -100,5 +108,17 @@ class Stack:
         for piece in self.pieces:
             piece.draw(screen)
         self.draw_stack(screen, turn)
+
+    # Items of all pieces and stacks for the FrameRenderer, in the order they are drawn
+    def items(self, screen, turn):
+        items = [piece.item(screen) for piece in self.pieces if piece.cell]
+        radius = HEX_RADIUS * 2 // 3
+        for player in (0, 1):
+            if self.stack[player] > 0:
+                x = 250 + 300 * player
+                rect = pygame.Rect(x - radius - 1, 600 - radius - 1, 2 * radius + 3, 2 * radius + 3)
+                key = ("stack", player, self.stack[player], self.highlighted and player == turn)
+                items.append((key, rect, partial(self.draw_available, screen, player, turn)))
+        return items
             
 stack = Stack()
\ No newline at end of file
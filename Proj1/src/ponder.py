@@ -0,0 +1,72 @@
+import threading
+import algorithm as alg
+from gamestate import GameState
+
+# Pondering: while the opponent (a human) thinks, a background thread keeps searching for the bot.
+# A Monte Carlo bot grows its session tree from the position the opponent has to play, and its
+# next search reuses the subtree of the move actually played. A minimax bot searches the position
+# after each opponent reply, likeliest replies first and one depth at a time: the results fill the
+# shared transposition table, and a finished search of the bot's own depth is played as it is
+
+PONDER_CHUNK = 20 # MCTS iterations between two checks of the stop event
+
+
+class Ponderer:
+    def __init__(self, player, session=None, depth=None):
+        self.player = player
+        self.session = session  # MCTSSession of a Monte Carlo bot, None for minimax
+        self.depth = depth      # Depth of a minimax bot, None when it is limited by time only
+        self.results = {}       # Position key (bot to move) -> (depth, move) of finished minimax searches
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # Starts pondering on state, where the opponent is to move
+    def start(self, state: GameState):
+        self.stop()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(state.clone(),), daemon=True)
+        self.thread.start()
+
+    # Stops the thread and waits for it, so the bot's search has the tree / table to itself
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def run(self, state: GameState):
+        if self.session is not None:
+            while not self.stop_event.is_set():
+                self.session.ponder(state, PONDER_CHUNK)
+        else:
+            self.ponder_minimax(state)
+
+    def ponder_minimax(self, state: GameState):
+        opponent = 1 - self.player
+        replies = alg.list_possible_moves(state, opponent)
+        if not replies:
+            return
+        # Likeliest replies first: the best ones for the opponent at depth 1
+        values = alg.search_root(state, opponent, replies, 1)
+        replies = [replies[i] for i in sorted(range(len(replies)), key=lambda i: -values[i])]
+
+        for depth in range(1, (self.depth or alg.MAX_DEPTH) + 1):
+            for reply in replies:
+                child = state.clone()
+                child.make_move(reply, opponent)
+                if alg.terminal_score(child, opponent) is not None:
+                    continue
+                move = alg.best_move(child, self.player, depth, cancel=self.stop_event)
+                if self.stop_event.is_set():
+                    return
+                self.results[child.hash ^ child.topology.zobrist_turn[self.player]] = (depth, move)
+
+    # Move found while pondering for state (bot to move), None unless a minimax search of the bot's
+    # depth was completed for it
+    def lookup(self, state: GameState):
+        if self.depth is None:
+            return None
+        result = self.results.get(state.hash ^ state.topology.zobrist_turn[self.player])
+        if result is not None and result[0] >= self.depth:
+            return result[1]
+        return None
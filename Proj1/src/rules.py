@@ -0,0 +1,140 @@
+from gamestate import GameState, iter_bits
+
+# Rules kernel shared by the GUI and the bots: legal moves and the end of the game.
+# Legal moves only depend on the pieces, the stacks and the side to move, which is exactly what the
+# position hash and the turn key cover, so the move list of a position is generated once and kept in
+# a fixed-size cache indexed by that key. Highlighting the moves of a piece, a hint and the searches
+# of the bots all read the same list. Move tuples are interned per board size, so a cached list only
+# holds references to them
+
+MOVE_CACHE_BITS = 15 # 32768 positions
+
+
+# Key of the move list of a position with player to move
+def move_key(state: GameState, player: int):
+    return state.hash ^ state.topology.zobrist_turn[player]
+
+
+class MoveCache:
+    def __init__(self, size_bits=MOVE_CACHE_BITS):
+        self.size = 1 << size_bits
+        self.mask = self.size - 1
+        self.clear()
+
+    # One (key, moves) pair per slot: the GUI, the search worker and the ponder thread share the
+    # cache, and a slot is replaced in a single assignment, so a key is never read with another list
+    def clear(self):
+        self.entries = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    # Tuple of moves of the position, None if it is not cached
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    # Always replaces: the last positions seen are the likeliest to be seen again
+    def store(self, key, moves):
+        self.entries[key & self.mask] = (key, moves)
+
+
+move_cache = MoveCache()
+
+
+# ------------------ MOVE TUPLES ------------------
+# The same tuple for every occurrence of a move: placements[cell] and movements[origin][destination]
+class MoveTable:
+    def __init__(self, cells):
+        self.placements = [("placement", cell_id) for cell_id in range(cells)]
+        self.movements = [[("move", origin, destination) for destination in range(cells)] for origin in range(cells)]
+
+
+_move_tables = {}
+
+def get_move_table(size):
+    if size not in _move_tables:
+        _move_tables[size] = MoveTable(size * size)
+    return _move_tables[size]
+
+
+# ------------------ LEGAL MOVES ------------------
+# The first piece a player places cannot go on a corner
+def is_first_placement(state: GameState, player: int):
+    return state.occupancy[player] == 0
+
+
+# Moves are ("placement", cell_id) or ("move", origin_id, destination_id)
+def generate_moves(state: GameState, player: int):
+    table = get_move_table(state.size)
+    moves = []
+    append = moves.append
+
+    # Placement moves: if there are pieces left in the stack
+    if state.stack[player] > 0:
+        free = state.topology.full & ~state.occupied()
+        if is_first_placement(state, player):
+            free &= ~state.topology.corner_mask
+        placements = table.placements
+        for cell_id in iter_bits(free):
+            append(placements[cell_id])
+
+    # Movement moves: for each piece of the player on the board
+    for origin in iter_bits(state.occupancy[player]):
+        movements = table.movements[origin]
+        for destination in iter_bits(state.destination_mask(origin, player)):
+            append(movements[destination])
+
+    return tuple(moves)
+
+
+# Legal moves of player in the position, from the cache when it was seen before. The tuple is shared:
+# callers that reorder it work on a copy
+def legal_moves(state: GameState, player: int):
+    key = move_key(state, player)
+    moves = move_cache.probe(key)
+    if moves is None:
+        moves = generate_moves(state, player)
+        move_cache.store(key, moves)
+    return moves
+
+
+def is_legal(state: GameState, move, player: int):
+    return move in legal_moves(state, player)
+
+
+# Destinations of the piece of player on cell_id
+def piece_destinations(state: GameState, cell_id: int, player: int):
+    return [move[2] for move in legal_moves(state, player) if move[0] == "move" and move[1] == cell_id]
+
+
+# ------------------ GAME OVER ------------------
+# Score of a finished game from player's point of view, None if the game goes on. Whoever makes 5 or
+# more in a row loses, on a placement as well; exactly 4 in a row wins, but only with a movement
+def terminal_score(state: GameState, player: int):
+    player_turn = state.last_player
+    if player_turn is None:
+        return None
+
+    # The last cell holds the mover's piece, so its longest line is kept by the state
+    longest = state.lines[state.last_cell]
+
+    if longest >= 5:
+        return -100000 if player_turn == player else 100000
+    if longest == 4 and state.last_type == "move":
+        return 100000 if player_turn == player else -100000
+
+    return None
+
+
+# Winner of the game after the last move played on state, None while the game goes on
+def winner(state: GameState):
+    if state.last_player is None:
+        return None
+    score = terminal_score(state, state.last_player)
+    if score is None:
+        return None
+    return state.last_player if score > 0 else 1 - state.last_player
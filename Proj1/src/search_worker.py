@@ -0,0 +1,59 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Searches on a background thread, so the GUI keeps drawing and handling events while a bot or a
+# hint thinks. submit() returns a SearchJob: the future of the move, the counters the search updates
+# as it runs (to show progress) and a cancel event, passed to the search as its `cancel` argument
+
+
+class SearchJob:
+    def __init__(self, stats=None):
+        self.stats = stats        # MCTSStats / SearchStats of the running search, or None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.start_time = None    # Set when the worker starts the search
+        self.end_time = None
+
+    def done(self):
+        return self.future.done()
+
+    # Move found, None if the search was cancelled before it had one
+    def result(self):
+        return self.future.result()
+
+    # Asks the search to stop; it returns soon after with the best move found so far
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    # Seconds spent searching so far
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+
+class SearchWorker:
+    def __init__(self):
+        # One thread: searches run one after the other and never share the tables at the same time
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+
+    # Runs function(*args, stats=stats, cancel=<event>, **kwargs) on the worker thread
+    def submit(self, function, *args, stats=None, **kwargs):
+        job = SearchJob(stats)
+
+        def run():
+            job.start_time = time.perf_counter()
+            try:
+                return function(*args, stats=stats, cancel=job.cancel_event, **kwargs)
+            finally:
+                job.end_time = time.perf_counter()
+
+        job.future = self.executor.submit(run)
+        return job
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,237 @@
+import argparse
+import bisect
+import mmap
+import os
+import random
+import struct
+import time
+from array import array
+from collections import deque
+from gamestate import GameState
+from opening_book import BOOK_FOLDER
+
+# Endgame tablebase: once both stacks are empty only movements are left, the piece count is fixed
+# and a position is fully described by the owners of the cells and the side to move. The value of
+# such a position is solved by retrograde analysis and stored as a signed distance in plies:
+# +d the side to move wins in d plies, -d it loses in d plies, 0 a draw (no way out of a cycle, or
+# no legal move). The file is memory-mapped like the opening book, but keys and distances are
+# stored as two separate arrays sorted by key, so a probe is cheap: the keys are viewed as a native
+# array of 64-bit integers and binary searched by bisect in C. The table only covers the endgames
+# reachable from its seed games, so minimax probes every endgame node and MCTS every new leaf, but
+# rollouts do not probe at all
+
+MAGIC = b"YHTB"
+HEADER = struct.Struct("<4sHHI4x")  # Magic, format version, SIZE, number of entries, padding
+VERSION = 2
+
+
+def tablebase_path(size):
+    return os.path.join(BOOK_FOLDER, f"endgame_{size}.bin")
+
+
+def table_key(state: GameState, player: int):
+    return state.hash ^ state.topology.zobrist_turn[player]
+
+
+# ------------------ READING ------------------
+class Tablebase:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an endgame tablebase of this version")
+        view = memoryview(self.data)
+        values_start = HEADER.size + 8 * self.count
+        self.keys = view[HEADER.size:values_start].cast("Q")
+        self.values = view[values_start:values_start + 2 * self.count].cast("h")
+
+    # Signed distance of the position with player to move, None when it was not solved
+    def probe(self, state: GameState, player: int):
+        key = table_key(state, player)
+        index = bisect.bisect_left(self.keys, key)
+        if index < self.count and self.keys[index] == key:
+            return self.values[index]
+        return None
+
+
+_tables = {}
+
+# Tablebase of a SIZE, None if none was generated for it
+def get_tablebase(size):
+    if size not in _tables:
+        path = tablebase_path(size)
+        _tables[size] = Tablebase(path) if os.path.exists(path) else None
+    return _tables[size]
+
+
+# Only positions with both stacks empty are in the tablebase
+def probe(state: GameState, player: int):
+    if state.stack[0] or state.stack[1]:
+        return None
+    table = get_tablebase(state.size)
+    return table.probe(state, player) if table is not None else None
+
+
+# ------------------ GENERATION ------------------
+WIN_NOW = -1   # Edge of a move that wins on the spot (exactly 4 in a row)
+LOSE_NOW = -2  # Edge of a move that loses on the spot (5 or more in a row)
+
+
+# Positions where both stacks just ran out, taken from self-play games with the rollout policy
+def seed_positions(size, games, seed=0, policy="pattern"):
+    import algorithm as alg
+
+    random.seed(seed)
+    choose = alg.ROLLOUT_POLICIES[policy]
+    seeds = []
+    for _ in range(games):
+        state = GameState(size)
+        turn = 0
+        while state.stack[0] or state.stack[1]:
+            moves = alg.list_possible_moves(state, turn)
+            if not moves:
+                break
+            state.make_move(choose(state, moves, turn, turn, 0.3), turn)
+            turn = 1 - turn
+            if alg.terminal_score(state, turn) is not None:
+                break
+        else:
+            seeds.append((state, turn))
+    return seeds
+
+
+# Movement graph reachable from the seeds, breadth first, expanding at most max_nodes positions.
+# Positions found beyond that are kept as unexpanded frontier nodes, whose value stays unknown.
+# Queued positions are only their occupancy masks, rebuilt into a state when expanded
+def expand(seeds, max_nodes):
+    import algorithm as alg
+
+    index = {}
+    keys, children = [], []
+    queue = deque()
+    for state, turn in seeds:
+        key = table_key(state, turn)
+        if key not in index:
+            index[key] = len(keys)
+            keys.append(key)
+            children.append(None)
+            queue.append((tuple(state.occupancy), turn))
+    size = seeds[0][0].size if seeds else 0
+
+    expanded = 0
+    while queue and expanded < max_nodes:
+        occupancy, turn = queue.popleft()
+        state = GameState(size, occupancy, (0, 0))
+        edges = []
+        for move in alg.list_possible_moves(state, turn):
+            state.make_move(move, turn)
+            score = alg.terminal_score(state, turn)
+            if score is not None:
+                edges.append(WIN_NOW if score > 0 else LOSE_NOW)
+            else:
+                key = table_key(state, 1 - turn)
+                if key not in index:
+                    index[key] = len(keys)
+                    keys.append(key)
+                    children.append(None)
+                    queue.append((tuple(state.occupancy), 1 - turn))
+                edges.append(index[key])
+            state.unmake_move()
+        children[index[table_key(state, turn)]] = edges
+        expanded += 1
+    return keys, children
+
+
+# Retrograde analysis of the expanded graph. Positions are solved in order of distance: a position
+# wins in d + 1 if a move leads to a loss in d, and loses in d + 1 once every move leads to a win,
+# the slowest in d. Unsolved positions from which no frontier node can be reached are draws
+def solve(keys, children):
+    count = len(keys)
+    value = [None] * count
+    parents = [[] for _ in range(count)]
+    remaining = [0] * count  # Moves of each position not yet known to lose
+    queue = deque()
+    for node, edges in enumerate(children):
+        if edges is None:
+            continue
+        for child in edges:
+            if child >= 0:
+                parents[child].append(node)
+                remaining[node] += 1
+        if WIN_NOW in edges:
+            value[node] = 1
+            queue.append(node)
+        elif not edges:
+            value[node] = 0
+        elif not remaining[node]:
+            value[node] = -1
+            queue.append(node)
+
+    while queue:
+        node = queue.popleft()
+        distance = abs(value[node]) + 1
+        for parent in parents[node]:
+            if value[parent] is not None:
+                continue
+            if value[node] < 0:
+                value[parent] = distance
+                queue.append(parent)
+            else:
+                remaining[parent] -= 1
+                if not remaining[parent]:
+                    value[parent] = -distance
+                    queue.append(parent)
+
+    # Unsolved positions that can reach the frontier are unknown, the others can never be decided
+    open_nodes = deque(node for node in range(count) if children[node] is None)
+    unknown = set(open_nodes)
+    while open_nodes:
+        for parent in parents[open_nodes.popleft()]:
+            if value[parent] is None and parent not in unknown:
+                unknown.add(parent)
+                open_nodes.append(parent)
+    return {keys[node]: 0 if value[node] is None else value[node]
+            for node in range(count) if children[node] is not None and node not in unknown}
+
+
+def generate(size, games=200, max_nodes=100000, seed=0, log=print):
+    start = time.perf_counter()
+    seeds = seed_positions(size, games, seed)
+    log(f"{len(seeds)} seed positions from {games} games, {time.perf_counter() - start:.0f} s")
+    keys, children = expand(seeds, max_nodes)
+    log(f"{len(keys)} positions, {sum(edges is not None for edges in children)} expanded, {time.perf_counter() - start:.0f} s")
+    entries = solve(keys, children)
+    wins = sum(value > 0 for value in entries.values())
+    losses = sum(value < 0 for value in entries.values())
+    log(f"{len(entries)} solved: {wins} wins, {losses} losses, {len(entries) - wins - losses} draws, "
+        f"{time.perf_counter() - start:.0f} s")
+    return entries
+
+
+def write_tablebase(path, size, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    keys = sorted(entries)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, size, len(keys)))
+        array("Q", keys).tofile(file)
+        array("h", (entries[key] for key in keys)).tofile(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the Yonmoque-Hex endgame tablebase of a board SIZE")
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--games", type=int, default=200, help="self-play games giving the seed positions")
+    parser.add_argument("--nodes", type=int, default=100000, help="positions expanded by the retrograde analysis")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="tablebase file (default: books/endgame_{SIZE}.bin)")
+    args = parser.parse_args()
+
+    entries = generate(args.size, args.games, args.nodes, args.seed)
+    path = args.output or tablebase_path(args.size)
+    write_tablebase(path, args.size, entries)
+    print(f"{len(entries)} positions written to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+from gamestate import AXES, iter_bits
+
+# Threat detection: which moves win, lose or make lines through flips, answered from the
+# bitboards without playing the moves. A move makes a line of a given length through its
+# destination only if the occupied cells around it (counting the destination) are already
+# that long on some axis, since flips can only turn enemy pieces into own ones; that cheap
+# test rules out almost every destination before the exact line and flips are computed
+
+
+# Mask of the cells in `cells` with at least `length` occupied cells in a row through them
+# on some axis, counting the cell itself
+def line_candidates(state, length, cells):
+    occupied = state.occupied()
+    candidates = 0
+    for cell_id in iter_bits(cells):
+        around = occupied | 1 << cell_id
+        for axis in AXES:
+            if state.count_in_mask(cell_id, around, axis) >= length:
+                candidates |= 1 << cell_id
+                break
+    return candidates
+
+
+def destination_mask(moves):
+    mask = 0
+    for move in moves:
+        mask |= 1 << move[-1]
+    return mask
+
+
+# Moves that complete a line of exactly 4 by movement (an immediate win)
+def winning_moves(state, player, moves):
+    movements = [move for move in moves if move[0] == "move"]
+    candidates = line_candidates(state, 4, destination_mask(movements))
+    if not candidates:
+        return []
+    return [move for move in movements if candidates >> move[2] & 1 and state.move_effect(move, player)[0] == 4]
+
+
+# Placements or moves that make a line of 5 or more (an immediate loss)
+def losing_moves(state, player, moves):
+    candidates = line_candidates(state, 5, destination_mask(moves))
+    if not candidates:
+        return []
+    return [move for move in moves if candidates >> move[-1] & 1 and state.move_effect(move, player)[0] >= 5]
+
+
+# Longest line through any piece a move flips (0 if it flips nothing). Callers that already have
+# the mask of flipped pieces from move_effect() pass it to avoid computing it again
+def flip_line(state, move, player, flipped=None):
+    if move[0] == "placement":
+        return 0
+    if flipped is None:
+        flipped = state.move_effect(move, player)[1]
+    if not flipped:
+        return 0
+    own = (state.occupancy[player] ^ (1 << move[1]) ^ (1 << move[2])) | flipped
+    return max(state.count_in_mask(cell_id, own, axis) for cell_id in iter_bits(flipped) for axis in AXES)
@@ -0,0 +1,221 @@
+import argparse
+import itertools
+import json
+import math
+import random
+import time
+import engine
+import parallel
+from logger import GameLogger
+
+# Headless bot-vs-bot tournaments: every pair of bot configurations plays a number of games on
+# each board SIZE, spread over the process pool, without any rendering. A configuration is written
+# as "algorithm:key=value,...", for example "minimax:depth=2", "minimax:time=500" (milliseconds per
+# move, as deep as time allows) or "mcts:iterations=100,policy=random". Bots play their opening
+# book moves unless the configuration says book=0
+
+MAX_PLIES = 200 # A game with no result after this many plies is a draw
+
+
+# ------------------ BOT CONFIGURATIONS ------------------
+def parse_config(text):
+    algorithm, _, options = text.partition(":")
+    if algorithm not in ("minimax", "mcts"):
+        raise ValueError(f"unknown algorithm in bot config {text!r}")
+    config = {"name": text, "algorithm": algorithm}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        config[key] = value if key == "policy" else int(value)
+    return config
+
+
+class Bot:
+    def __init__(self, config, player, search_stats=True):
+        self.config = config
+        self.player = player
+        self.search_stats = search_stats
+        self.last_stats = None # Search counters of the last move (None when not collected)
+        self.use_book = bool(config.get("book", 1))
+        # Monte Carlo bots keep their tree between turns, like in the GUI
+        self.session = None
+        if config["algorithm"] == "mcts":
+            self.session = engine.MCTSSession(player, config.get("policy", engine.ROLLOUT_POLICY))
+
+    def choose(self, state):
+        if self.session is not None:
+            stats = engine.MCTSStats() if self.search_stats else None
+            move = self.session.best_move(state, self.config.get("iterations", 100), stats, self.use_book)
+        else:
+            depth = self.config.get("depth")
+            time_budget = self.config.get("time")
+            if depth is None and time_budget is None:
+                depth = 2
+            stats = engine.SearchStats() if self.search_stats else None
+            move = engine.best_move(state, self.player, depth, time_budget=time_budget, stats=stats, use_book=self.use_book)
+        self.last_stats = stats.log_fields() if stats is not None else None
+        return move
+
+    def record(self, move):
+        if self.session is not None:
+            self.session.record(move)
+
+
+# ------------------ GAMES ------------------
+# Plays one game from the empty board, configs[p] playing player p. Returns the winner (None for
+# a draw: no legal move or MAX_PLIES reached), the moves, their latencies and search counters and
+# the final position
+def play_game(size, configs, seed=0, max_plies=MAX_PLIES, search_stats=True):
+    random.seed(seed)
+    bots = [Bot(config, player, search_stats) for player, config in enumerate(configs)]
+    state = engine.GameState(size)
+    moves = []
+    latencies = []
+    stats = []
+    winner = None
+    turn = 0
+    for _ in range(max_plies):
+        if not engine.list_possible_moves(state, turn):
+            break
+        start_time = time.perf_counter()
+        move = bots[turn].choose(state)
+        latencies.append(time.perf_counter() - start_time)
+        stats.append(bots[turn].last_stats)
+        moves.append(move)
+        for bot in bots:
+            bot.record(move)
+        state.make_move(move, turn)
+        winner = engine.winner(state)
+        if winner is not None:
+            break
+        turn = 1 - turn
+    return {"size": size, "players": [config["name"] for config in configs], "seed": seed, "winner": winner,
+            "moves": moves, "latencies": latencies, "stats": stats, "state": state}
+
+
+# Writes a game in the same text format as the GUI games
+def save_game_log(game, folder, name):
+    logger = GameLogger("computer_vs_computer", game["players"], game["size"])
+    for ply, (move, latency, stats) in enumerate(zip(game["moves"], game["latencies"], game["stats"])):
+        if move[0] == "placement":
+            logger.log_move(latency, ply % 2, "placement", move[1], stats=stats)
+        else:
+            logger.log_move(latency, ply % 2, "move", move[2], move[1], stats)
+    logger.set_winner(game["winner"])
+    logger.start_time -= sum(game["latencies"]) # Total time of the game is its thinking time
+    logger.save_to_file(game["state"], folder, name)
+
+
+# Every pair of configurations plays `games` games per SIZE, alternating who starts
+def schedule(configs, sizes, games, seed=0):
+    rng = random.Random(seed)
+    jobs = []
+    for size in sizes:
+        for first, second in itertools.combinations(configs, 2):
+            for game in range(games):
+                players = [first, second] if game % 2 == 0 else [second, first]
+                jobs.append((size, players, rng.getrandbits(32)))
+    return jobs
+
+
+# ------------------ RATINGS ------------------
+# Elo ratings (mean 0) fitted to the games with the Bradley-Terry model. Every pair also gets one
+# virtual draw, so a configuration that never scores still has a finite rating
+def fit_elo(games, names, iterations=100):
+    index = {name: i for i, name in enumerate(names)}
+    count = len(names)
+    scores = [[0.5] * count for _ in range(count)]  # scores[i][j]: points of i against j
+    played = [[1.0] * count for _ in range(count)]
+    for game in games:
+        a, b = (index[name] for name in game["players"])
+        score = 0.5 if game["winner"] is None else float(game["winner"] == 0)
+        scores[a][b] += score
+        scores[b][a] += 1 - score
+        played[a][b] += 1
+        played[b][a] += 1
+
+    strengths = [1.0] * count
+    for _ in range(iterations):
+        for i in range(count):
+            total = sum(scores[i][j] for j in range(count) if j != i)
+            weight = sum(played[i][j] / (strengths[i] + strengths[j]) for j in range(count) if j != i)
+            strengths[i] = total / weight
+        mean_log = sum(math.log(strength) for strength in strengths) / count
+        strengths = [strength / math.exp(mean_log) for strength in strengths]
+    return [400 * math.log10(strength) for strength in strengths]
+
+
+# Per configuration: games, wins, draws, losses, win rate, Elo with a bootstrap confidence
+# interval and mean move latency
+def summarize(games, names, confidence=0.95, resamples=200, seed=0):
+    rng = random.Random(seed)
+    elo = fit_elo(games, names)
+    samples = [fit_elo([rng.choice(games) for _ in games], names) for _ in range(resamples)]
+    low_rank = int((1 - confidence) / 2 * resamples)
+    high_rank = min(resamples - 1, int((1 + confidence) / 2 * resamples))
+
+    summary = []
+    for i, name in enumerate(names):
+        record = {"wins": 0, "draws": 0, "losses": 0}
+        latency, moves = 0.0, 0
+        for game in games:
+            if name not in game["players"]:
+                continue
+            player = game["players"].index(name)
+            if game["winner"] is None:
+                record["draws"] += 1
+            elif game["winner"] == player:
+                record["wins"] += 1
+            else:
+                record["losses"] += 1
+            latency += sum(game["latencies"][player::2])
+            moves += len(game["latencies"][player::2])
+        played = sum(record.values())
+        ratings = sorted(sample[i] for sample in samples)
+        summary.append({"config": name, "games": played, **record,
+                        "win_rate": record["wins"] / played if played else 0.0,
+                        "elo": elo[i], "elo_low": ratings[low_rank], "elo_high": ratings[high_rank],
+                        "mean_latency": latency / moves if moves else 0.0})
+    return summary
+
+
+# ------------------ COMMAND LINE ------------------
+def main():
+    parser = argparse.ArgumentParser(description="Headless Yonmoque-Hex bot tournament")
+    parser.add_argument("configs", nargs="+", help='bot configurations, e.g. "minimax:depth=2" "mcts:iterations=100"')
+    parser.add_argument("--games", type=int, default=10, help="games per pair of configurations and SIZE")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5])
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="tournament.jsonl", help="one JSON line per game")
+    parser.add_argument("--game-logs", help="also write every game to this folder in the GUI log format")
+    parser.add_argument("--no-search-stats", action="store_true", help="do not collect the search counters of each move")
+    args = parser.parse_args()
+
+    configs = [parse_config(text) for text in args.configs]
+    if len(configs) < 2:
+        parser.error("a tournament needs at least two bot configurations")
+    names = [config["name"] for config in configs]
+    jobs = schedule(configs, args.sizes, args.games, args.seed)
+
+    pool = parallel.get_pool(args.workers)
+    futures = [pool.submit(play_game, size, players, seed, MAX_PLIES, not args.no_search_stats) for size, players, seed in jobs]
+    games = []
+    with open(args.output, "w") as file:
+        for number, future in enumerate(futures):
+            game = future.result()
+            games.append(game)
+            file.write(json.dumps({key: value for key, value in game.items() if key != "state"}) + "\n")
+            if args.game_logs:
+                save_game_log(game, args.game_logs, f"{number + 1:05d}")
+    parallel.shutdown_pool()
+
+    for size in args.sizes:
+        print(f"SIZE {size}:")
+        for result in summarize([game for game in games if game["size"] == size], names, seed=args.seed):
+            print(f"  {result['config']:<32} {result['games']:>5} games  {result['win_rate']:6.1%} wins  "
+                  f"{result['draws']:>4} draws  Elo {result['elo']:+6.0f} [{result['elo_low']:+.0f}, {result['elo_high']:+.0f}]  "
+                  f"{result['mean_latency'] * 1000:8.1f} ms/move")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Fixed-size transposition table for minimax, indexed by Zobrist hash
+
+EXACT, LOWER, UPPER = 0, 1, 2 # Kind of value stored in an entry
+
+
+# Key of a search node: position hash plus side to move and the player the values are scored for
+def position_key(state, player, to_move):
+    topology = state.topology
+    return state.hash ^ topology.zobrist_turn[to_move] ^ topology.zobrist_root[player]
+
+
+class TranspositionTable:
+    def __init__(self, size_bits=16):
+        self.size = 1 << size_bits
+        self.mask = self.size - 1
+        self.clear()
+
+    def clear(self):
+        # One list per field instead of an object per entry
+        self.keys = [None] * self.size
+        self.depths = [0] * self.size
+        self.values = [0] * self.size
+        self.flags = [EXACT] * self.size
+        self.moves = [None] * self.size
+        self.filled = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0        # Probes that found the position
+        self.misses = 0      # Probes on an empty slot or another position
+        self.collisions = 0  # Misses where the slot held a different position
+        self.stores = 0      # Entries written
+        self.rejected = 0    # Stores skipped because the slot held a deeper search
+
+    # Returns (depth, value, flag, move) or None
+    def probe(self, key):
+        index = key & self.mask
+        stored = self.keys[index]
+        if stored == key:
+            self.hits += 1
+            return self.depths[index], self.values[index], self.flags[index], self.moves[index]
+        self.misses += 1
+        if stored is not None:
+            self.collisions += 1
+        return None
+
+    # Depth-preferred replacement: never overwrite a deeper search of another position
+    def store(self, key, depth, value, flag, move):
+        index = key & self.mask
+        stored = self.keys[index]
+        if stored is None:
+            self.filled += 1
+        elif stored != key and self.depths[index] > depth:
+            self.rejected += 1
+            return
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.values[index] = value
+        self.flags[index] = flag
+        self.moves[index] = move
+        self.stores += 1
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "entries": self.size,
+            "filled": self.filled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / probes if probes else 0.0,
+        }